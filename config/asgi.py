@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Load the product search index before serving, not in the first search request.
+from store.search import load_product_index  # noqa: E402
+
+load_product_index()
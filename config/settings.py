@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -43,18 +44,18 @@ INSTALLED_APPS = [
     'rest_framework',
     'djoser',
     
-    'debug_toolbar',
     'store.apps.StoreConfig',
     'core.apps.CoreConfig',
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +64,11 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# The toolbar adds its own overhead to every request, so only load it in development.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -97,6 +103,30 @@ DATABASES = {
     }
 }
 
+# STORE_DB=sqlite runs the project (e.g. the benchmarks) without a MySQL server.
+# STORE_DB=sqlite-replica adds a second SQLite database as a read replica.
+if os.environ.get('STORE_DB') in ('sqlite', 'sqlite-replica'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+
+# Read replicas for safe-method catalog requests, as {alias: weight}; each
+# alias also needs a DATABASES entry, e.g.
+#   DATABASES['replica1'] = {**DATABASES['default'], 'HOST': 'replica1', 'TEST': {'MIRROR': 'default'}}
+# See core.replicas.
+DATABASE_REPLICAS = {}
+if os.environ.get('STORE_DB') == 'sqlite-replica':
+    # Not replicated: tests (core.tests) write to each database separately.
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.replica.sqlite3'}
+    DATABASE_REPLICAS = {'replica': 1}
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# After a write, the client's reads stay on the primary for this many seconds.
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -145,7 +175,7 @@ REST_FRAMEWORK = {
     # 'PAGE_SIZE': 10,
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CALSSES': [
     #   'rest_framework.permission.IsAuthenticated',  
@@ -164,4 +194,37 @@ DJOSER = {
     }
 }
 
-AUTH_USER_MODEL = 'core.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.CustomUser'
+
+# Users authenticated by JWT are cached per process. Changes made in another
+# process (deactivation, password change) take up to this long to apply here.
+AUTH_USER_CACHE_TIMEOUT = 60
+AUTH_USER_CACHE_MAXSIZE = 10000
+
+# Added on top of discounted prices, see store.pricing.
+STORE_TAX_RATE = '0.09'
+
+# Each process loads the product search index at startup (store.search) and
+# catches up with other processes' product changes this often.
+PRODUCT_SEARCH_REFRESH_SECONDS = 60
+
+# Max SQL queries per route (resolved view name). A plain route budgets its
+# GET/HEAD/OPTIONS requests, (route, method) any method. Going over is logged,
+# or raised as core.metrics.QueryBudgetExceeded with QUERY_BUDGET_ACTION = 'raise'.
+QUERY_BUDGETS = {
+    'product-list': 6,
+    'product-detail': 4,
+    'category-list': 3,
+    'category-detail': 3,
+    'comment-product-list': 4,
+    'carts-detail': 4,
+    'cart-items-list': 4,
+    'orders-list': 6,
+    'orders-detail': 6,
+    ('orders-list', 'POST'): 14,
+}
+QUERY_BUDGET_ACTION = 'log'
+
+# /metrics answers scrapers sending `Authorization: Bearer <METRICS_TOKEN>`,
+# and staff users; everyone else gets 403.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.budget_exceeded = 0
+
+
+class MetricsRegistry:
+    """
+    Per-route request metrics kept in process memory. Every worker process
+    has its own registry, so each one should be scraped on its own.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.collectors = []
+
+    def observe(self, route, method, duration, queries, sql_seconds, budget_exceeded=False):
+        with self.lock:
+            metrics = self.routes.get((route, method))
+            if metrics is None:
+                metrics = self.routes[(route, method)] = RouteMetrics()
+            metrics.latency.observe(duration)
+            metrics.queries.observe(queries)
+            metrics.sql_seconds += sql_seconds
+            metrics.budget_exceeded += budget_exceeded
+
+    def register_collector(self, collector):
+        """Add a callable returning extra Prometheus text lines for /metrics."""
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency per route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            routes = sorted(self.routes.items())
+            for (route, method), metrics in routes:
+                lines.extend(metrics.latency.render('http_request_duration_seconds', label(route, method)))
+            lines += ['# HELP http_request_sql_queries SQL queries per request.',
+                      '# TYPE http_request_sql_queries histogram']
+            for (route, method), metrics in routes:
+                lines.extend(metrics.queries.render('http_request_sql_queries', label(route, method)))
+            lines += ['# HELP http_request_sql_seconds_total Time spent in SQL per route.',
+                      '# TYPE http_request_sql_seconds_total counter']
+            lines += [f'http_request_sql_seconds_total{{{label(route, method)}}} {metrics.sql_seconds}'
+                      for (route, method), metrics in routes]
+            lines += ['# HELP http_request_query_budget_exceeded_total Requests over their query budget.',
+                      '# TYPE http_request_query_budget_exceeded_total counter']
+            lines += [f'http_request_query_budget_exceeded_total{{{label(route, method)}}} {metrics.budget_exceeded}'
+                      for (route, method), metrics in routes]
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+def label(route, method):
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'route="{route}",method="{method}"'
+
+
+registry = MetricsRegistry()
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and the time spent in them."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_query_budget(route, method):
+    """
+    The budget for (route, method) in QUERY_BUDGETS; a key of just the route
+    only budgets its safe methods, as writes on a route cost more than reads.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    budget = budgets.get((route, method))
+    if budget is None and method in SAFE_METHODS:
+        budget = budgets.get(route)
+    return budget
+
+
+def report_query_budget(route, method, queries, budget):
+    """Log the overrun, or raise it when QUERY_BUDGET_ACTION is 'raise'."""
+    message = f'{method} {route} ran {queries} SQL queries, its budget is {budget}'
+    if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
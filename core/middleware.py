@@ -0,0 +1,50 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+from .metrics import QueryCounter, get_query_budget, registry, report_query_budget
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, SQL query count and SQL time per resolved route
+    (e.g. `product-list`) and enforces QUERY_BUDGETS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.track(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.track(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def track(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            yield
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        budget = get_query_budget(route, request.method)
+        exceeded = budget is not None and counter.count > budget
+        registry.observe(route, request.method, duration, counter.count, counter.seconds, exceeded)
+        if exceeded:
+            report_query_budget(route, request.method, counter.count, budget)
@@ -0,0 +1,132 @@
+"""
+Read replica routing.
+
+DATABASE_REPLICAS maps database aliases to weights. Views using
+`ReplicaReadMixin` run their safe-method requests against one replica,
+picked by weight, for the whole request. Everything else stays on the
+primary (`default`): writes, reads inside `transaction.atomic()` blocks,
+and every read of a client that wrote within the last REPLICA_PIN_SECONDS,
+so clients see their own writes. `ReplicaPinMiddleware` records those
+writes: in a cookie, and for authenticated users also in the cache, for
+clients that don't keep cookies. REPLICA_PIN_SECONDS must exceed the
+replicas' lag; store.cache also fills the response cache from the primary
+for that long after a change, so other clients can't cache pre-write data.
+
+`manage.py test core` with STORE_DB=sqlite-replica runs against a primary
+and a replica that are two separate SQLite databases.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+from rest_framework.permissions import SAFE_METHODS
+
+
+PIN_COOKIE = 'primary_until'
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def choose_replica():
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    return random.choices(list(replicas), weights=list(replicas.values()))[0]
+
+
+def get_read_alias(request):
+    """The replica `request` should read from, or None for the primary."""
+    if request.method not in SAFE_METHODS or is_pinned(request):
+        return None
+    return choose_replica()
+
+
+@contextmanager
+def use_database(alias):
+    """Route reads to `alias` (None: the primary) inside the block."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def get_pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def is_pinned(request):
+    """Whether the client wrote recently enough that it must read from the primary."""
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and cache.get(get_pin_key(user.pk)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would write instances back to the replica they were read from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Runs safe-method requests of a view against a replica (see the module docstring)."""
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = get_read_alias(request)
+        if alias is not None:
+            self.replica_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self.replica_token = None
+        return response
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Pins clients to the primary for REPLICA_PIN_SECONDS after a successful write."""
+    def process_response(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not get_replicas():
+            return response
+        seconds = get_pin_seconds()
+        response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True,
+                            samesite='Lax')
+        # DRF sets the user it authenticated (e.g. from a JWT) on the Django request too.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            cache.set(get_pin_key(user.pk), 1, timeout=seconds)
+        return response
@@ -1,3 +1,192 @@
-from django.test import TestCase
+import time
+import unittest
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from core.metrics import QueryBudgetExceeded
+from core.replicas import PIN_COOKIE, ReplicaPinMiddleware, get_read_alias, use_database
+from store import factories
+from store.cache import response_cache
+from store.models import Cart, CartItem, Category, Product
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'run with STORE_DB=sqlite-replica')
+class ReplicaRoutingTests(TransactionTestCase):
+    """The primary and the replica are separate databases holding differently named rows."""
+    databases = set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        for db in ('default', 'replica'):
+            Category.objects.using(db).bulk_create([Category(id=1, title=db)])
+            Product.objects.using(db).bulk_create([Product(id=1, name=db, slug='p', category_id=1, description='',
+                                                           unit_price=10, inventory=10)])
+        self.age('product:1', 'category:1', 'product:all', 'category:all')
+
+    def age(self, *scopes):
+        """Make the scopes' versions look older than the pin window."""
+        response_cache.cache.set_many(
+            {response_cache.version_key(scope): f'{int(time.time()) - 3600}.{scope}' for scope in scopes},
+            timeout=None,
+        )
+
+    def product_name(self, client, prefix=''):
+        # Uncached, so every call shows where the request read from.
+        # LocMemCache stores keys as made by make_key(): ':<version>:<key>'.
+        cache.delete_many([key.split(':', 2)[2] for key in list(cache._cache) if ':response:' in key])
+        response = client.get(f'/store/{prefix}products/1/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['name']
+
+    def test_safe_requests_read_the_replica(self):
+        client = APIClient()
+        self.assertEqual(self.product_name(client), 'replica')
+        self.assertEqual(client.get('/store/categories/1/').json()['title'], 'replica')
+
+    def test_async_routes_read_the_replica(self):
+        self.assertEqual(self.product_name(APIClient(), prefix='async/'), 'replica')
+
+    def test_writes_and_atomic_blocks_use_the_primary(self):
+        with use_database('replica'):
+            product = Product.objects.get(pk=1)
+            self.assertEqual(product.name, 'replica')
+            with transaction.atomic():
+                self.assertEqual(Product.objects.get(pk=1).name, 'default')
+            product.inventory = 3
+            product.save(update_fields=['inventory'])
+        self.assertEqual(Product.objects.using('default').get(pk=1).inventory, 3)
+        self.assertEqual(Product.objects.using('replica').get(pk=1).inventory, 10)
+
+    def test_clients_read_their_own_writes(self):
+        staff = factories.CustomerFactory()
+        staff.user.is_staff = True
+        staff.user.save()
+        writer, reader = APIClient(), APIClient()
+        writer.force_authenticate(staff.user)
+        response = writer.patch('/store/categories/1/', {'title': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.age('category:1', 'product:1')
+
+        self.assertEqual(self.product_name(writer), 'default')
+        self.assertEqual(self.product_name(reader), 'replica')
+        writer.cookies[PIN_COOKIE] = str(time.time() - 1)
+        writer.force_authenticate(None)
+        self.assertEqual(self.product_name(writer), 'replica')
+
+    def test_users_are_pinned_without_cookies(self):
+        customer = factories.CustomerFactory()
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product_id=1, quantity=1)
+        client = APIClient()
+        client.force_authenticate(customer.user)
+        self.assertEqual(client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json').status_code, 200)
+        client.cookies.clear()
+        self.age('product:1')
+
+        self.assertEqual(self.product_name(client), 'default')
+        self.assertEqual(self.product_name(APIClient()), 'replica')
+
+    def test_cache_fills_after_a_change_use_the_primary(self):
+        self.assertEqual(self.product_name(APIClient()), 'replica')
+        # A change the (lagging) replica hasn't seen yet.
+        Product.objects.using('default').filter(pk=1).update(name='changed')
+        response_cache.invalidate('product:1')
+
+        client = APIClient()
+        response = client.get('/store/products/1/')
+        self.assertEqual(response.json()['name'], 'changed')
+        response = client.get('/store/products/1/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['name'], 'changed')
+
+
+class MetricsEndpointTests(TestCase):
+    def test_anonymous_clients_are_forbidden(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrapers_authenticate_with_the_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_staff_users_may_read_metrics(self):
+        user = factories.CustomerFactory().user
+        user.is_staff = True
+        user.save()
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_no_api_root_is_mounted_at_the_site_root(self):
+        self.assertEqual(self.client.get('/').status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS={'replica': 1}, REPLICA_PIN_SECONDS=5)
+class ReplicaPinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = factories.CustomerFactory().user
+        self.middleware = ReplicaPinMiddleware(lambda request: HttpResponse())
+
+    def request(self, method='get', user=None, **cookies):
+        request = getattr(RequestFactory(), method)('/store/products/')
+        request.COOKIES.update(cookies)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_successful_writes_pin_the_client_and_user(self):
+        response = self.middleware.process_response(self.request('post', self.user), HttpResponse(status=201))
+        until = float(response.cookies[PIN_COOKIE].value)
+        self.assertAlmostEqual(until, time.time() + 5, delta=1)
+        self.assertIsNone(get_read_alias(self.request(**{PIN_COOKIE: str(until)})))
+        self.assertIsNone(get_read_alias(self.request(user=self.user)))
+        self.assertEqual(get_read_alias(self.request()), 'replica')
+
+    def test_reads_and_failed_writes_do_not_pin(self):
+        for method, status in [('get', 200), ('post', 400)]:
+            response = self.middleware.process_response(self.request(method, self.user), HttpResponse(status=status))
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(get_read_alias(self.request(user=self.user)), 'replica')
+
+    def test_expired_or_bad_cookies_do_not_pin(self):
+        self.assertEqual(get_read_alias(self.request(**{PIN_COOKIE: str(time.time() - 1)})), 'replica')
+        self.assertEqual(get_read_alias(self.request(**{PIN_COOKIE: 'x'})), 'replica')
+        self.assertIsNone(get_read_alias(self.request('post')))
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                              unit_price=10, inventory=5)
+        self.client = APIClient()
+
+    def test_reads_over_budget_fail(self):
+        with override_settings(QUERY_BUDGETS={'product-list': 0}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'GET product-list ran'):
+                self.client.get('/store/products/')
+
+    def checkout(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return self.client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json')
+
+    def test_writes_are_held_to_their_own_budget(self):
+        self.client.force_authenticate(factories.CustomerFactory().user)
+        # The orders-list GET budget doesn't apply to checkout.
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'orders-list': 1}):
+            self.assertEqual(self.checkout().status_code, 200)
+        with override_settings(QUERY_BUDGETS={('orders-list', 'POST'): 1}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'POST orders-list ran'):
+                self.checkout()
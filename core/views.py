@@ -1,3 +1,19 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
 
-# Create your views here.
+from .metrics import registry
+
+
+def is_metrics_client(request):
+    """A scraper presenting METRICS_TOKEN as a bearer token, or a staff user."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics(request):
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,7 @@
 from typing import Any
 from django.contrib import admin, messages
-from django.db.models import Count
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 from django.urls import reverse
@@ -8,6 +9,15 @@ from django.utils.html import format_html
 from django.utils.http import urlencode
 
 from . import models
+from .paginations import EstimatedCountPaginator
+
+
+def count_related(model, field):
+    """Correlated COUNT subquery; unlike Count() it needs no JOIN and GROUP BY over the whole table."""
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts), 0)
 
 
 class CommentProduct(admin.TabularInline):
@@ -50,6 +60,8 @@ class ProductAdmin(admin.ModelAdmin):
     list_per_page = 50
     list_select_related = ['category']
     list_filter = ['datetime_created', InventoryFilter]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     actions = ['clear_inventory']
     search_fields = ['name']
     prepopulated_fields = {
@@ -62,7 +74,7 @@ class ProductAdmin(admin.ModelAdmin):
     
     
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('comments').annotate(count_comment=Count('comments'))
+        return super().get_queryset(request).annotate(count_comment=count_related(models.Comment, 'product'))
     
     
     def inve_sta(self, product):
@@ -107,13 +119,16 @@ class OrderAdmin(admin.ModelAdmin):
     list_editable = ['status']
     ordering = ['id']
     list_per_page = 10
-    search_fields = ['customer__first_name']
+    list_select_related = ['customer__user']
+    search_fields = ['customer__user__first_name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [
         OrderItemOrder,
     ]
     
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('items').annotate(count=Count('items'))
+        return super().get_queryset(request).annotate(count=count_related(models.OrderItem, 'order'))
     
     
     @admin.display(ordering='count', description='# Items')
@@ -126,8 +141,11 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'product', 'status']
     list_editable = ['status']
     list_per_page = 250
+    list_select_related = ['product']
     ordering = ['id']
     autocomplete_fields = ['product',]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(models.Customer)
@@ -6,3 +6,4 @@ class StoreConfig(AppConfig):
     
     def ready(self) -> None:
         import store.signals.handlers
+        import store.outbox
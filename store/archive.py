@@ -0,0 +1,121 @@
+"""
+Cold storage of closed orders.
+
+`archive_orders()` moves paid and canceled orders older than a cutoff from
+Order/OrderItem into ArchivedOrder rows, whose items are zlib-compressed
+JSON. Orders move `batch_size` at a time, each batch in its own short
+transaction, so the hot tables are never locked for long. Only orders the
+sales aggregates already reflect are moved (see store.sales).
+
+`get_archived_order()` turns an archived row back into unsaved Order and
+OrderItem instances, so the order serializers read it like a live order.
+"""
+import json
+import time
+import zlib
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import ArchivedOrder, Customer, Order, OrderItem, Product
+
+
+CLOSED_STATUSES = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_CANCELED]
+# Each archived item is a list of these values. The product's name and price
+# are kept in case the product is deleted once no live order item protects it.
+ITEM_FIELDS = ['id', 'product_id', 'quantity', 'unit_price', 'product_name', 'product_unit_price']
+
+
+def pack_items(rows):
+    rows = [[str(value) if isinstance(value, Decimal) else value for value in row] for row in rows]
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def unpack_items(data):
+    return [dict(zip(ITEM_FIELDS, row)) for row in json.loads(zlib.decompress(bytes(data)))]
+
+
+def get_archivable(cutoff):
+    return Order.objects.filter(
+        status__in=CLOSED_STATUSES, datetime_created__lt=cutoff, sales_status=F('status'),
+    )
+
+
+def archive_batch(order_ids):
+    """Move the given orders, as far as they are still archivable; returns (orders, compressed bytes)."""
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update().filter(
+                pk__in=order_ids, status__in=CLOSED_STATUSES, sales_status=F('status'),
+            ).order_by('pk').values_list('pk', 'customer_id', 'datetime_created', 'status')
+        )
+        if not orders:
+            return 0, 0
+        ids = [order[0] for order in orders]
+        items = {}
+        for order_id, *row in OrderItem.objects.filter(order_id__in=ids).order_by('pk').values_list(
+            'order_id', 'pk', 'product_id', 'quantity', 'unit_price', 'product__name', 'product__unit_price',
+        ):
+            items.setdefault(order_id, []).append(row)
+        archived = ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(id=pk, customer_id=customer_id, datetime_created=created, status=status,
+                          items=pack_items(items.get(pk, [])))
+            for pk, customer_id, created, status in orders
+        ])
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(pk__in=ids).delete()
+    return len(orders), sum(len(order.items) for order in archived)
+
+
+def archive_orders(cutoff, batch_size=500, limit=None, pause=0):
+    """
+    Archive every archivable order created before `cutoff`, oldest ids first.
+    `pause` seconds are slept between batches. Returns (orders, compressed bytes).
+    """
+    total = size = 0
+    last_pk = 0
+    while limit is None or total < limit:
+        count = batch_size if limit is None else min(batch_size, limit - total)
+        ids = list(get_archivable(cutoff).filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:count])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        moved, moved_size = archive_batch(ids)
+        total += moved
+        size += moved_size
+        if pause:
+            time.sleep(pause)
+    return total, size
+
+
+def get_archived_order(**filters):
+    """
+    The archived order matching `filters` as an unsaved Order, with its
+    customer (and user) and items (and products) already loaded, or None.
+    """
+    archived = ArchivedOrder.objects.filter(**filters).first()
+    if archived is None:
+        return None
+    order = Order(id=archived.pk, customer_id=archived.customer_id, datetime_created=archived.datetime_created,
+                  status=archived.status, sales_status=archived.status)
+    order._state.adding = False
+    order.customer = Customer.objects.select_related('user').get(pk=archived.customer_id)
+
+    rows = unpack_items(archived.items)
+    products = Product.objects.in_bulk({row['product_id'] for row in rows})
+    items = []
+    for row in rows:
+        product = products.get(row['product_id'])
+        if product is None:
+            product = Product(id=row['product_id'], name=row['product_name'],
+                              unit_price=Decimal(row['product_unit_price']))
+        item = OrderItem(id=row['id'], order=order, product=product, quantity=row['quantity'],
+                         unit_price=Decimal(row['unit_price']))
+        item._state.adding = False
+        items.append(item)
+    # What prefetch_related('items') would have left behind.
+    queryset = OrderItem.objects.filter(order_id=order.pk)
+    queryset._result_cache, queryset._prefetch_done = items, True
+    order._prefetched_objects_cache = {'items': queryset}
+    return order
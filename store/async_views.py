@@ -0,0 +1,110 @@
+"""
+Async versions of the read-only catalog endpoints, for deployments served
+through config.asgi. They reuse the viewsets' filter backends, paginators
+and serializers and only swap the database access for the async ORM, so
+filtering, ordering and pagination behave exactly like the sync routes.
+Responses are cached in `response_cache` the same way, under their own
+paths.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from core import replicas
+
+from . import pricing
+from .cache import response_cache, set_validators
+from .filters import ProductSearchFilter
+from .search import get_product_index
+from .views import CategoryViewSet, CommentViewSet, ProductViewSet
+
+
+renderer = JSONRenderer()
+
+
+def render(data, status=200, cache=None):
+    response = HttpResponse(renderer.render(data), status=status, content_type='application/json')
+    if cache:
+        response['X-Cache'] = cache
+    return response
+
+
+def read_only(viewset, action):
+    """Run an async GET handler against an instance of `viewset`, DRF-style errors included."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(request, **kwargs):
+            request = Request(request)
+            request.accepted_renderer = renderer
+            view = viewset(request=request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+            try:
+                if request.method not in ('GET', 'HEAD'):
+                    raise MethodNotAllowed(request.method)
+                # The same replica routing as the viewsets' ReplicaReadMixin.
+                with replicas.use_database(await sync_to_async(replicas.get_read_alias)(request)):
+                    versions = await response_cache.aget_versions(view.get_cache_scopes())
+                    key = response_cache.build_key(request, versions)
+                    not_modified, validators = response_cache.get_not_modified(request, key, versions)
+                    if not_modified is not None:
+                        response_cache.record(view.cache_resource, 'not_modified')
+                        return not_modified
+                    data = await response_cache.cache.aget(key)
+                    if data is not None:
+                        response_cache.record(view.cache_resource, 'hits')
+                        return set_validators(render(data, cache='HIT'), *validators)
+                    response_cache.record(view.cache_resource, 'misses')
+                    with response_cache.fill_from(versions):
+                        data = await func(view, **kwargs)
+            except APIException as exc:
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                return render(data, exc.status_code)
+            await response_cache.cache.aset(key, data, view.get_cache_timeout())
+            return set_validators(render(data, cache='MISS'), *validators)
+        return wrapper
+    return decorator
+
+
+async def filter_queryset(view):
+    if ProductSearchFilter.search_param in view.request.query_params:
+        # Catching up with other processes' changes reads the database.
+        await sync_to_async(get_product_index)()
+    return view.filter_queryset(view.get_queryset())
+
+
+@read_only(ProductViewSet, 'list')
+async def product_list(view):
+    queryset = await filter_queryset(view)
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+    await sync_to_async(pricing.attach_prices)(page)
+    serializer = view.get_serializer(page, many=True)
+    return view.paginator.get_paginated_response(serializer.data).data
+
+
+@read_only(ProductViewSet, 'retrieve')
+async def product_detail(view, pk):
+    queryset = await filter_queryset(view)
+    try:
+        product = await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise NotFound('No Product matches the given query.')
+    await sync_to_async(pricing.attach_prices)([product])
+    return view.get_serializer(product).data
+
+
+@read_only(CategoryViewSet, 'list')
+async def category_list(view):
+    categories = [category async for category in view.get_queryset()]
+    return view.get_serializer(categories, many=True).data
+
+
+@read_only(CommentViewSet, 'list')
+async def product_comment_list(view, product_pk):
+    queryset = view.filter_queryset(view.get_queryset())
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+    serializer = view.get_serializer(page, many=True)
+    return view.paginator.get_paginated_response(serializer.data).data
@@ -0,0 +1,131 @@
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.metrics import registry
+
+
+class UserCache:
+    """
+    Per-process LRU of authenticated users, each loaded with its customer.
+
+    Saves and deletes of users and customers evict the entry (see
+    store.signals.handlers); other processes only notice after
+    AUTH_USER_CACHE_TIMEOUT seconds.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'AUTH_USER_CACHE_MAXSIZE', 10000)
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, user_id, user):
+        if self.timeout <= 0:
+            return
+        with self.lock:
+            self.entries[str(user_id)] = (time.monotonic() + self.timeout, user)
+            self.entries.move_to_end(str(user_id))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        key = str(user_id)
+
+        def evict():
+            with self.lock:
+                self.entries.pop(key, None)
+
+        evict()
+        # Again after commit, in case a request cached the old row meanwhile.
+        transaction.on_commit(evict)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def collect_metrics(self):
+        with self.lock:
+            stats, size = dict(self.stats), len(self.entries)
+        return [
+            '# HELP store_auth_user_cache_total Authenticated user cache lookups.',
+            '# TYPE store_auth_user_cache_total counter',
+            *[f'store_auth_user_cache_total{{outcome="{outcome}"}} {stats.get(outcome, 0)}'
+              for outcome in ('hits', 'misses')],
+            '# HELP store_auth_user_cache_size Users currently cached in this process.',
+            '# TYPE store_auth_user_cache_size gauge',
+            f'store_auth_user_cache_size {size}',
+        ]
+
+
+user_cache = UserCache()
+registry.register_collector(user_cache.collect_metrics)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that takes the user from `user_cache`. Users are
+    loaded together with their customer, so `request.user.customer` is
+    free for the rest of the request.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related('customer').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+            user_cache.set(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return self.copy_user(user)
+
+    @staticmethod
+    def copy_user(user):
+        """A copy the request can modify without touching the cached instance."""
+        user = copy.copy(user)
+        customer = user._state.fields_cache.get('customer')
+        if customer is not None:
+            user.customer = copy.copy(customer)
+        return user
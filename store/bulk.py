@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.text import slugify
+
+from rest_framework import serializers
+
+from .models import Category, Order, OrderItem, Product
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def guess_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_rows(rows, columns, format):
+    """Yield CSV or NDJSON lines for an iterable of row tuples."""
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def read_rows(file, format):
+    """
+    Parse an upload incrementally. Yields (row_number, data, error) where
+    exactly one of data and error is set.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='' if format == 'csv' else None)
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row, None
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            yield number, None, {'non_field_errors': [f'Invalid JSON: {error}']}
+            continue
+        if not isinstance(data, dict):
+            yield number, None, {'non_field_errors': ['Each line must be a JSON object.']}
+            continue
+        yield number, data, None
+
+
+PRODUCT_EXPORT_COLUMNS = ['id', 'name', 'slug', 'category', 'unit_price', 'inventory', 'description']
+
+
+def export_products(queryset, format, chunk_size=2000):
+    rows = queryset.order_by('pk').values_list(
+        'id', 'name', 'slug', 'category_id', 'unit_price', 'inventory', 'description'
+    ).iterator(chunk_size=chunk_size)
+    return stream_rows(rows, PRODUCT_EXPORT_COLUMNS, format)
+
+
+ORDER_EXPORT_COLUMNS = ['order_id', 'datetime_created', 'status', 'customer_id', 'customer_email',
+                        'item_id', 'product_id', 'product_name', 'quantity', 'unit_price']
+
+
+def export_orders(queryset, format, chunk_size=1000):
+    """
+    Stream orders with their items. CSV has one line per order item, NDJSON
+    one object per order with a nested `items` list. Orders are read
+    `chunk_size` at a time and their items are prefetched per chunk.
+    """
+    orders = queryset.select_related('customer__user').only(
+        'id', 'datetime_created', 'status', 'customer_id', 'customer__user__email',
+    ).prefetch_related(
+        Prefetch('items', OrderItem.objects.select_related('product').only(
+            'id', 'order_id', 'product_id', 'quantity', 'unit_price', 'product__name',
+        ))
+    ).order_by('pk').iterator(chunk_size=chunk_size)
+
+    if format == 'csv':
+        def rows():
+            for order in orders:
+                head = (order.id, order.datetime_created, order.status, order.customer_id, order.customer.user.email)
+                items = order.items.all()
+                if not items:
+                    yield head + (None,) * 5
+                for item in items:
+                    yield head + (item.id, item.product_id, item.product.name, item.quantity, item.unit_price)
+        return stream_rows(rows(), ORDER_EXPORT_COLUMNS, format)
+
+    def documents():
+        for order in orders:
+            yield (order.id, order.datetime_created, order.status, order.customer_id, order.customer.user.email, [
+                {'id': item.id, 'product_id': item.product_id, 'product_name': item.product.name,
+                 'quantity': item.quantity, 'unit_price': item.unit_price}
+                for item in order.items.all()
+            ])
+    return stream_rows(documents(), ['id', 'datetime_created', 'status', 'customer_id', 'customer_email', 'items'], format)
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False, allow_null=True)
+    slug = serializers.SlugField(required=False, allow_blank=True, max_length=50)
+    category = serializers.IntegerField()
+    description = serializers.CharField(allow_blank=True, default='')
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'category', 'unit_price', 'inventory', 'description']
+
+    def validate(self, data):
+        if len(data['name']) < 6:
+            raise serializers.ValidationError({'name': 'Product title shoulde be at leate 6'})
+        return data
+
+
+class ProductImporter:
+    """
+    Creates or updates products from parsed rows, `chunk_size` rows per
+    transaction, matching existing products by `slug` or `id`. Every chunk
+    costs a constant number of queries: one for categories, one for the
+    existing products, one bulk_create and one bulk_update. Rows that match
+    the stored product exactly are skipped.
+
+    Chunks that were written stay written when later rows fail, unless
+    `atomic` is set: then the whole upload is one transaction, rolled back
+    (and reported as such) if any row failed.
+    """
+    update_fields = ['name', 'slug', 'category', 'unit_price', 'inventory', 'description']
+    max_reported_errors = 1000
+
+    def __init__(self, key='slug', chunk_size=1000, dry_run=False, atomic=False):
+        if key not in ('slug', 'id'):
+            raise ValueError("key must be 'slug' or 'id'")
+        self.key = key
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.atomic = atomic
+        self.report = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'rolled_back': False, 'errors': []}
+
+    def add_error(self, number, errors):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < self.max_reported_errors:
+            self.report['errors'].append({'row': number, 'errors': errors})
+
+    def run(self, rows):
+        if not self.atomic:
+            return self.import_rows(rows)
+        with transaction.atomic():
+            self.import_rows(rows)
+            if self.report['failed'] and not self.dry_run:
+                transaction.set_rollback(True)
+                self.report.update(created=0, updated=0, rolled_back=True)
+        return self.report
+
+    def import_rows(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return self.report
+            self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        valid = []
+        for number, data, error in chunk:
+            if error is not None:
+                self.add_error(number, error)
+                continue
+            serializer = ProductImportSerializer(data=data)
+            if not serializer.is_valid():
+                self.add_error(number, serializer.errors)
+                continue
+            values = serializer.validated_data
+            values['slug'] = values.get('slug') or slugify(values['name'])[:50]
+            if self.key == 'id' and values.get('id') is None:
+                self.add_error(number, {'id': ['This field is required when importing by id.']})
+                continue
+            valid.append((number, values))
+
+        categories = set(Category.objects.filter(
+            pk__in={values['category'] for _, values in valid}
+        ).values_list('pk', flat=True))
+        existing = {}
+        for product in Product.objects.filter(**{f'{self.key}__in': {values[self.key] for _, values in valid}}):
+            existing.setdefault(getattr(product, self.key), []).append(product)
+
+        to_create, to_update, seen = [], [], set()
+        for number, values in valid:
+            key = values[self.key]
+            if values['category'] not in categories:
+                self.add_error(number, {'category': [f'Invalid pk "{values["category"]}" - object does not exist.']})
+                continue
+            if key in seen:
+                self.add_error(number, {self.key: ['Duplicate key in this upload.']})
+                continue
+            seen.add(key)
+            matches = existing.get(key, [])
+            if len(matches) > 1:
+                self.add_error(number, {self.key: ['More than one product has this slug.']})
+                continue
+            values['category_id'] = values.pop('category')
+            values.pop('id', None)
+            if matches:
+                product = matches[0]
+                changed = [field for field, value in values.items() if getattr(product, field) != value]
+                if not changed:
+                    self.report['unchanged'] += 1
+                    continue
+                for field in changed:
+                    setattr(product, field, values[field])
+                to_update.append(product)
+            elif self.key == 'id':
+                self.add_error(number, {'id': ['No product with this id.']})
+            else:
+                to_create.append(Product(**values))
+
+        if not self.dry_run:
+            with transaction.atomic():
+                if to_create:
+                    Product.objects.bulk_create(to_create)
+                if to_update:
+                    Product.objects.bulk_update(to_update, self.update_fields)
+        self.report['created'] += len(to_create)
+        self.report['updated'] += len(to_update)
@@ -0,0 +1,239 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
+
+from rest_framework.response import Response
+
+from core import replicas
+from core.metrics import registry
+
+
+class ResponseCache:
+    """
+    Versioned read-through cache for GET responses.
+
+    Every cached response is keyed by the versions of the scopes it depends
+    on (e.g. `product:list`, `product:42`). Invalidation replaces a scope's
+    version with a new random token, which orphans every entry built on the
+    old one; nothing has to be deleted or enumerated. Versions are bumped
+    after the surrounding transaction commits so a concurrent reader can
+    never store pre-commit data under the new version.
+
+    The same versions give responses their ETag and Last-Modified
+    validators: a version token starts with the time it was issued.
+    """
+    prefix = 'store'
+
+    def __init__(self):
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'STORE_RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'STORE_RESPONSE_CACHE_TIMEOUT', 300)
+
+    @property
+    def version_timeout(self):
+        # Versions outlive no response built on them. A process whose cache
+        # never saw a bump (e.g. LocMemCache) stops using the old version,
+        # and the ETag derived from it, within this time.
+        return self.timeout
+
+    @staticmethod
+    def new_version():
+        return f'{int(time.time())}.{uuid4().hex}'
+
+    def version_key(self, scope):
+        return f'{self.prefix}:version:{scope}'
+
+    def get_versions(self, scopes):
+        keys = [self.version_key(scope) for scope in scopes]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # add() keeps a concurrent bump from being overwritten.
+                version = self.new_version()
+                self.cache.add(key, version, timeout=self.version_timeout)
+                versions[key] = self.cache.get(key, version)
+        return [versions[key] for key in keys]
+
+    async def aget_versions(self, scopes):
+        keys = [self.version_key(scope) for scope in scopes]
+        versions = await self.cache.aget_many(keys)
+        for key in keys:
+            if key not in versions:
+                version = self.new_version()
+                await self.cache.aadd(key, version, timeout=self.version_timeout)
+                versions[key] = await self.cache.aget(key, version)
+        return [versions[key] for key in keys]
+
+    def invalidate(self, *scopes):
+        scopes = [scope for scope in scopes if scope]
+        if not scopes:
+            return
+
+        def bump():
+            self.cache.set_many({self.version_key(scope): self.new_version() for scope in scopes},
+                                timeout=self.version_timeout)
+
+        transaction.on_commit(bump)
+
+    def build_key(self, request, versions):
+        params = sorted(
+            (name, value) for name, values in request.query_params.lists() for value in values if value != ''
+        )
+        fingerprint = hashlib.md5(
+            f'{request.path}?{urlencode(params)}|{request.accepted_renderer.format}'.encode()
+        ).hexdigest()
+        versions = ':'.join(versions)
+        return f'{self.prefix}:response:{fingerprint}:{hashlib.md5(versions.encode()).hexdigest()}'
+
+    @staticmethod
+    def get_changed_at(versions):
+        """Timestamp of the newest of `versions`, or None."""
+        try:
+            return max(int(version.split('.', 1)[0]) for version in versions)
+        except ValueError:
+            # A version issued before tokens carried their time.
+            return None
+
+    def get_validators(self, request, key, versions):
+        """(strong ETag, Last-Modified timestamp or None) of the response cached under `key`."""
+        media_type = getattr(request, 'accepted_media_type', '')
+        etag = quote_etag(hashlib.md5(f'{key}|{media_type}'.encode()).hexdigest())
+        last_modified = self.get_changed_at(versions)
+        if last_modified is not None and last_modified >= int(time.time()):
+            # A change later in this second would carry the same Last-Modified,
+            # and If-Modified-Since would then wrongly answer 304.
+            last_modified = None
+        return etag, last_modified
+
+    def fill_from(self, versions):
+        """
+        Where a miss should be built: on the primary for REPLICA_PIN_SECONDS
+        after a version changed, as a lagging replica would store the data
+        from before the change under the new version.
+        """
+        changed_at = self.get_changed_at(versions)
+        if changed_at is None or time.time() - changed_at <= replicas.get_pin_seconds() + 1:
+            return replicas.use_database(None)
+        return nullcontext()
+
+    def get_not_modified(self, request, key, versions):
+        """
+        (304/412 response or None, validators) for the request's
+        If-None-Match/If-Modified-Since headers.
+        """
+        validators = self.get_validators(request, key, versions)
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            set_validators(response, *validators)
+        return response, validators
+
+    def record(self, resource, outcome):
+        with self.stats_lock:
+            self.stats[outcome] += 1
+            self.stats[f'{resource}.{outcome}'] += 1
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def collect_metrics(self):
+        lines = ['# HELP store_response_cache_total Response cache lookups per resource.',
+                 '# TYPE store_response_cache_total counter']
+        for name, value in sorted(self.get_stats().items()):
+            if '.' in name:
+                resource, outcome = name.split('.', 1)
+                lines.append(f'store_response_cache_total{{resource="{resource}",outcome="{outcome}"}} {value}')
+        return lines
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+response_cache = ResponseCache()
+registry.register_collector(response_cache.collect_metrics)
+
+
+@checks.register(checks.Tags.caches)
+def check_response_cache_is_shared(app_configs, **kwargs):
+    backend = settings.CACHES[getattr(settings, 'STORE_RESPONSE_CACHE_ALIAS', 'default')]['BACKEND']
+    if backend.endswith(('.LocMemCache', '.DummyCache')):
+        return [checks.Warning(
+            'The response cache is not shared between processes.',
+            hint='Invalidations only reach the process that made the change; the others serve stale '
+                 'responses and ETags for up to STORE_RESPONSE_CACHE_TIMEOUT seconds. Point '
+                 'STORE_RESPONSE_CACHE_ALIAS at a shared cache such as Redis or Memcached.',
+            id='store.W001',
+        )]
+    return []
+
+
+class CachedResponseMixin:
+    """
+    Serves list and retrieve from `response_cache`. Views declare the
+    scopes a response depends on through `get_cache_scopes()`. Details also
+    depend on `<resource>:all`, for changes too wide to name each object.
+    """
+    cache_resource = None
+
+    def get_cache_scopes(self):
+        if self.action == 'retrieve':
+            return [
+                f'{self.cache_resource}:{self.kwargs[self.lookup_url_kwarg or self.lookup_field]}',
+                f'{self.cache_resource}:all',
+            ]
+        return [f'{self.cache_resource}:list']
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        versions = response_cache.get_versions(self.get_cache_scopes())
+        key = response_cache.build_key(request, versions)
+        not_modified, validators = response_cache.get_not_modified(request, key, versions)
+        if not_modified is not None:
+            response_cache.record(self.cache_resource, 'not_modified')
+            return not_modified
+
+        data = response_cache.cache.get(key)
+        if data is not None:
+            response_cache.record(self.cache_resource, 'hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return set_validators(response, *validators)
+
+        response_cache.record(self.cache_resource, 'misses')
+        with response_cache.fill_from(versions):
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.cache.set(key, response.data, self.get_cache_timeout())
+        response['X-Cache'] = 'MISS'
+        return set_validators(response, *validators)
+
+    def get_cache_timeout(self):
+        return response_cache.timeout
@@ -0,0 +1,170 @@
+"""
+Compiled read-only serializers for list endpoints.
+
+`compile_serializer()` turns a ModelSerializer into the values_list()
+lookups it reads and a function building, from each row tuple, the same
+dict DRF would build from a model instance. Nested serializers become
+joins, or one extra query per page for reverse foreign keys (many=True).
+SerializerMethodFields get a stand-in object per row carrying `pk` and
+the attributes listed for them in `Meta.field_sources`; a serializer's
+`prepare_batch()` sees all of a page's stand-ins first.
+"""
+import types
+from collections import defaultdict
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import SparseFieldsetMixin
+
+
+# Fields whose to_representation() returns database values unchanged.
+IDENTITY_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+)
+
+
+def get_converter(field):
+    """A function applied to non-null values, or None when they pass through as is."""
+    if isinstance(field, IDENTITY_FIELDS) or type(field) is serializers.ChoiceField:
+        return None
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # values_list() already returns the related primary key.
+        return None
+    if isinstance(field, serializers.DecimalField):
+        to_representation = field.to_representation
+        if getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return to_representation
+        # What DRF's JSON encoder would turn the Decimal into.
+        return lambda value: float(to_representation(value))
+    if isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.TimeField,
+                          serializers.UUIDField)):
+        return field.to_representation
+    raise ImproperlyConfigured(f'{type(field).__name__} {field.field_name!r} cannot be compiled.')
+
+
+class CompiledSerializer:
+    def __init__(self, serializer_class, field_names=None):
+        self.model = serializer_class.Meta.model
+        self.lookups = ['pk']
+        # (field name, foreign key attname on the child model, CompiledSerializer)
+        self.children = []
+        # stand-in attribute -> row index, for method fields
+        self.stand_in_attrs = {}
+        self.serializer = serializer_class()
+        fields = [field for field in self.serializer._readable_fields
+                  if field_names is None or field.field_name in field_names]
+        self.build = self.compile(self.serializer, fields, '')
+
+    def add_lookup(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return self.lookups.index(lookup)
+
+    def compile(self, serializer, fields, prefix):
+        getters = [(field.field_name, self.compile_field(serializer, field, prefix)) for field in fields]
+
+        def build(row, related, stand_in):
+            return {name: getter(row, related, stand_in) for name, getter in getters}
+        return build
+
+    def compile_field(self, serializer, field, prefix):
+        name = field.field_name
+        if isinstance(field, serializers.SerializerMethodField):
+            sources = getattr(serializer.Meta, 'field_sources', {}).get(name)
+            if not sources or prefix:
+                raise ImproperlyConfigured(
+                    f'{name!r} needs an entry in {type(serializer).__name__}.Meta.field_sources '
+                    'and can only be compiled on the outermost serializer.'
+                )
+            self.stand_in_attrs.update((attr, self.add_lookup(attr)) for attr in sources)
+            method = getattr(serializer, field.method_name)
+            return lambda row, related, stand_in: method(stand_in)
+
+        if not field.source_attrs:
+            raise ImproperlyConfigured(f"{name!r} uses source='*' and cannot be compiled.")
+        source = prefix + '__'.join(field.source_attrs)
+
+        if isinstance(field, serializers.ListSerializer):
+            relation = self.model._meta.get_field(source)
+            if prefix or not relation.one_to_many:
+                raise ImproperlyConfigured(f'{name!r} must be a reverse foreign key of {self.model.__name__}.')
+            child = CompiledSerializer(type(field.child))
+            child.add_lookup(relation.field.attname)
+            self.children.append((name, relation.field.attname, child))
+            return lambda row, related, stand_in: related[name].get(row[0], [])
+
+        if isinstance(field, serializers.BaseSerializer):
+            pk = self.add_lookup(source + '__pk')
+            build = self.compile(field, list(field._readable_fields), source + '__')
+            return lambda row, related, stand_in: None if row[pk] is None else build(row, related, stand_in)
+
+        index = self.add_lookup(source)
+        convert = get_converter(field)
+        if convert is None:
+            return lambda row, related, stand_in: row[index]
+        return lambda row, related, stand_in: None if row[index] is None else convert(row[index])
+
+    def prepare(self, queryset):
+        """The queryset as named row tuples; ordering columns are kept for keyset pagination."""
+        lookups = list(self.lookups)
+        for field in queryset.query.order_by or self.model._meta.ordering:
+            if isinstance(field, str) and field.lstrip('-') not in lookups and field != '?':
+                lookups.append(field.lstrip('-'))
+        return queryset.prefetch_related(None).values_list(*lookups, named=True)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        related = {}
+        if rows:
+            pks = [row[0] for row in rows]
+            for name, attname, child in self.children:
+                queryset = child.model._default_manager.filter(**{f'{attname}__in': pks})
+                children = queryset.order_by(*child.model._meta.ordering or ['pk']).values_list(*child.lookups)
+                children = list(children)
+                fk = child.lookups.index(attname)
+                groups = defaultdict(list)
+                for child_row, data in zip(children, child.serialize(children)):
+                    groups[child_row[fk]].append(data)
+                related[name] = groups
+        stand_ins = [None] * len(rows)
+        if self.stand_in_attrs:
+            attrs = self.stand_in_attrs.items()
+            stand_ins = [types.SimpleNamespace(pk=row[0], **{attr: row[i] for attr, i in attrs}) for row in rows]
+            if hasattr(self.serializer, 'prepare_batch'):
+                self.serializer.prepare_batch(stand_ins)
+        build = self.build
+        return [build(row, related, stand_in) for row, stand_in in zip(rows, stand_ins)]
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class, field_names=None):
+    return CompiledSerializer(serializer_class, field_names)
+
+
+class CompiledListMixin:
+    """
+    Serves list() through the compiled form of the view's serializer.
+    The output is the same as the regular list(), sparse fieldsets included.
+    """
+    def get_compiled_serializer(self):
+        serializer_class = self.get_serializer_class()
+        field_names = None
+        if issubclass(serializer_class, SparseFieldsetMixin):
+            field_names = serializer_class.get_sparse_field_names(self.request, serializer_class().fields)
+        return compile_serializer(serializer_class, None if field_names is None else frozenset(field_names))
+
+    def list(self, request, *args, **kwargs):
+        compiled = self.get_compiled_serializer()
+        queryset = compiled.prepare(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(queryset))
@@ -0,0 +1,49 @@
+from django.db import connections, router
+
+
+def upsert_increment(model, rows, unique_fields, increment_fields, using=None):
+    """
+    Insert `rows` (dicts keyed by field name) or, when a row with the same
+    `unique_fields` already exists, add the new values of `increment_fields`
+    to it. Everything happens in a single INSERT ... ON CONFLICT / ON
+    DUPLICATE KEY UPDATE statement. Rows are written in unique-key order so
+    concurrent upserts lock index entries in the same order.
+    """
+    if not rows:
+        return 0
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    opts = model._meta
+    fields = [opts.get_field(name) for name in rows[0]]
+    unique_columns = [opts.get_field(name).column for name in unique_fields]
+    increment_columns = [opts.get_field(name).column for name in increment_fields]
+
+    rows = sorted(rows, key=lambda row: tuple(row[name] for name in unique_fields))
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    params = [
+        field.get_db_prep_save(row[field.name], connection)
+        for row in rows
+        for field in fields
+    ]
+    table = quote(opts.db_table)
+    sql = 'INSERT INTO %s (%s) VALUES %s' % (
+        table,
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join([placeholders] * len(rows)),
+    )
+    if connection.vendor == 'mysql':
+        sql += ' ON DUPLICATE KEY UPDATE %s' % ', '.join(
+            f'{quote(column)} = {quote(column)} + VALUES({quote(column)})' for column in increment_columns
+        )
+    else:
+        sql += ' ON CONFLICT (%s) DO UPDATE SET %s' % (
+            ', '.join(quote(column) for column in unique_columns),
+            ', '.join(
+                f'{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}'
+                for column in increment_columns
+            ),
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
@@ -1,8 +1,9 @@
 import random
 import factory
-from datetime import datetime
+from datetime import date
 from faker import Faker
 from factory.django import DjangoModelFactory
+from django.conf import settings
 
 from . import models
 
@@ -39,15 +40,29 @@ class ProductFactory(DjangoModelFactory):
     inventory = factory.LazyFunction(lambda: random.randint(1, 100))
 
 
-class CustomerFactory(DjangoModelFactory):
+class UserFactory(DjangoModelFactory):
     class Meta:
-        model = models.Customer
+        model = settings.AUTH_USER_MODEL
 
+    username = factory.Sequence(lambda n: f'user{n}')
+    email = factory.LazyAttribute(lambda x: f'{x.username}@example.com')
     first_name = factory.Faker("first_name")
     last_name = factory.Faker("last_name")
-    email = factory.Faker("email")
+
+
+class CustomerFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Customer
+
+    user = factory.SubFactory(UserFactory)
     phone_number = factory.Faker("phone_number")
-    birth_date = factory.LazyFunction(lambda: faker.date_time_ad(start_datetime=datetime(1990,1,1), end_datetime=datetime(2015,1,1)))
+    birth_date = factory.LazyFunction(lambda: faker.date_between_dates(date(1990, 1, 1), date(2015, 1, 1)))
+
+    @classmethod
+    def _create(cls, model_class, *args, **kwargs):
+        # Saving the user has already created its customer (see store.signals.handlers).
+        customer, _ = model_class.objects.update_or_create(user=kwargs.pop('user'), defaults=kwargs)
+        return customer
 
 
 class AddressFactory(DjangoModelFactory):
@@ -0,0 +1,114 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+def parse_names(value):
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin for `?fields=a,b` and `?exclude=c` on GET requests.
+    Naming a field the serializer doesn't have is a 400.
+
+    Only the top-level serializer of a response is trimmed. Fields that
+    read model columns other than their own source list them in
+    `Meta.field_sources`, e.g. `{'price_after_tax': ['unit_price']}`.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_response_root():
+            return fields
+        names = self.get_sparse_field_names(self.context.get('request'), fields)
+        if names is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in names}
+
+    def is_response_root(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, ListSerializer) and parent.parent is None)
+
+    @staticmethod
+    def get_sparse_field_names(request, fields):
+        """The field names to keep, or None when the request doesn't ask for a subset."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        requested, excluded = parse_names(params.get('fields')), parse_names(params.get('exclude'))
+        if requested is None and excluded is None:
+            return None
+        errors = {
+            param: [f'Unknown fields: {", ".join(sorted(names - set(fields)))}.']
+            for param, names in (('fields', requested), ('exclude', excluded))
+            if names and names - set(fields)
+        }
+        if errors:
+            raise ValidationError(errors)
+        names = set(fields) if requested is None else set(fields) & requested
+        return names - (excluded or set())
+
+    @classmethod
+    def prune_queryset(cls, queryset, request):
+        """
+        Defer the columns and drop the select_related/prefetch_related
+        lookups that only the fields left out of the response need.
+        """
+        fields = cls().get_fields()
+        names = cls.get_sparse_field_names(request, fields)
+        if names is None:
+            return queryset
+
+        field_sources = getattr(cls.Meta, 'field_sources', {})
+        needed = set()
+        for name in names:
+            # Unbound fields have no source yet; it defaults to the field name.
+            sources = field_sources.get(name) or [fields[name].source or name]
+            needed.update(source.split('.')[0] for source in sources if source != '*')
+
+        opts = queryset.model._meta
+        # Keyset pagination reads the ordering columns off the last row.
+        ordering = queryset.query.order_by or opts.ordering
+        needed.update(field.lstrip('-').split('__')[0] for field in ordering if isinstance(field, str))
+
+        deferred = [
+            field.name for field in opts.concrete_fields
+            if not field.primary_key and field.name not in needed
+        ]
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            paths = [path for path in flatten_select_related(select_related) if path.split('__')[0] in needed]
+            queryset = queryset.select_related(None)
+            if paths:
+                queryset = queryset.select_related(*paths)
+
+        lookups = queryset._prefetch_related_lookups
+        if lookups:
+            kept = [
+                lookup for lookup in lookups
+                if getattr(lookup, 'prefetch_through', lookup).split('__')[0] in needed
+            ]
+            queryset = queryset.prefetch_related(None).prefetch_related(*kept)
+
+        return queryset.defer(*deferred) if deferred else queryset
+
+
+def flatten_select_related(tree, prefix=''):
+    paths = []
+    for name, children in tree.items():
+        path = prefix + name
+        paths.extend(flatten_select_related(children, path + '__') if children else [path])
+    return paths
+
+
+class SparseFieldsetViewMixin:
+    """Prunes the view's queryset to what its (sparse) serializer will read."""
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, SparseFieldsetMixin):
+            queryset = serializer_class.prune_queryset(queryset, self.request)
+        return queryset
@@ -1,6 +1,11 @@
-from django_filters.rest_framework import FilterSet
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django_filters.rest_framework import FilterSet, ChoiceFilter, DateTimeFilter
 
-from .models import Product
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Order, Product
+from .search import get_product_index, tokenize
 
 
 class ProductFilterSet(FilterSet):
@@ -8,4 +13,59 @@ class ProductFilterSet(FilterSet):
         model = Product
         fields = {
             'inventory': ['lt', 'gt'], 
-        }
\ No newline at end of file
+        }
+
+
+class OrderFilterSet(FilterSet):
+    status = ChoiceFilter(choices=Order.ORDER_STATUS)
+    created_after = DateTimeFilter(field_name='datetime_created', lookup_expr='gte')
+    created_before = DateTimeFilter(field_name='datetime_created', lookup_expr='lt')
+
+    class Meta:
+        model = Order
+        fields = ['status', 'created_after', 'created_before']
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Ranks `?search=` matches with the in-process BM25 index instead of
+    running `icontains` scans. Results keep the relevance order unless an
+    explicit `?ordering=` is applied after this backend. A process that
+    hasn't loaded the index (see store.search) falls back to the scan.
+    """
+    search_param = api_settings.SEARCH_PARAM
+    max_results = 1000
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        index = get_product_index()
+        if index is None:
+            return self.scan(queryset, query)
+        ranked = index.search(query, limit=self.max_results)
+        if not ranked:
+            return queryset.none()
+        ids = [product_id for product_id, score in ranked]
+        rank = Case(*[When(pk=product_id, then=Value(position)) for position, product_id in enumerate(ids)],
+                    output_field=IntegerField())
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('search_rank')
+
+    def scan(self, queryset, query):
+        """The unranked `icontains` search, for processes that haven't loaded the index."""
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        condition = Q()
+        for token in tokens:
+            condition &= Q(name__icontains=token) | Q(description__icontains=token) | Q(category__title__icontains=token)
+        return queryset.filter(condition).annotate(search_rank=F('pk')).order_by('search_rank')
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'A search term.',
+            'schema': {'type': 'string'},
+        }]
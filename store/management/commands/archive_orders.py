@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import archive
+
+
+class Command(BaseCommand):
+    help = "Moves paid and canceled orders older than --days into compressed ArchivedOrder rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Archive orders created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders moved per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after this many orders')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the archivable orders')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        if options['dry_run']:
+            self.stdout.write(f"{archive.get_archivable(cutoff).count()} orders created before {cutoff:%Y-%m-%d} can be archived.")
+            return
+        start = time.perf_counter()
+        orders, size = archive.archive_orders(
+            cutoff, batch_size=options['batch_size'], limit=options['limit'], pause=options['pause'],
+        )
+        self.stdout.write(
+            f"Archived {orders} orders created before {cutoff:%Y-%m-%d} into {size / 1024:.1f} KiB "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
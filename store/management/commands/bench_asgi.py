@@ -0,0 +1,125 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmark import summarize
+
+
+DEFAULT_PATHS = ['products/', 'products/?page=2&ordering=name', 'categories/']
+
+
+class HTTPConnection:
+    """Just enough of a keep-alive HTTP/1.1 client to load-test JSON GETs."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\nAccept: application/json\r\n\r\n'.encode()
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection') == 'close':
+            await self.close()
+        return int(status_line.split()[1])
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def load(url_base, paths, concurrency, duration):
+    parts = urlsplit(url_base)
+    prefix = parts.path.rstrip('/') + '/'
+    samples, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        connection = HTTPConnection(parts.hostname, parts.port or 80)
+        index = offset
+        while time.perf_counter() < deadline:
+            path = prefix + paths[index % len(paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                status = await connection.get(path)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                errors += 1
+                await connection.close()
+                continue
+            if status == 200:
+                samples.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {'rps': round(len(samples) / elapsed, 1), 'errors': errors, **summarize(samples)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares requests/sec and latency of the catalog routes on a running WSGI server with the "
+        "async routes on a running ASGI server, e.g. `gunicorn config.wsgi -w 4 -b :8001` and "
+        "`uvicorn config.asgi:application --workers 4 --port 8000`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', help='Base URL of the WSGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--asgi', help='Base URL of the ASGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS,
+                            help='Paths relative to /store/ (or /store/async/ on the ASGI server)')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per target')
+
+    def handle(self, *args, **options):
+        targets = []
+        if options['wsgi']:
+            targets.append(('wsgi sync views', options['wsgi'].rstrip('/') + '/store/'))
+        if options['asgi']:
+            base = options['asgi'].rstrip('/')
+            # The sync views under ASGI show what running them in a thread per request costs.
+            targets.append(('asgi sync views', base + '/store/'))
+            targets.append(('asgi async views', base + '/store/async/'))
+        if not targets:
+            raise CommandError('Pass --wsgi and/or --asgi with the base URL of a running server.')
+
+        self.stdout.write(f"{'target':<18} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}")
+        for name, url in targets:
+            result = asyncio.run(load(url, options['paths'], options['concurrency'], options['duration']))
+            self.stdout.write(
+                f"{name:<18} {result['rps']:>9} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms "
+                f"{result['p99_ms']:>7.1f}ms {result['errors']:>7}"
+            )
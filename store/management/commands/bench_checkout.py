@@ -0,0 +1,126 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.db.models import Sum
+
+from rest_framework import serializers
+
+from store.benchmark import summarize
+from store.models import Cart, CartItem, Category, Customer, Order, OrderItem, Product
+from store.serializers import OrderCreateSerializer
+
+
+class Command(BaseCommand):
+    help = "Concurrent checkout load test: verifies inventory is never oversold and reports orders/sec"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--orders-per-client', type=int, default=10)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument('--inventory', type=int, default=200)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated rows')
+
+    def handle(self, *args, **options):
+        tag = f'bench-checkout-{uuid4().hex[:8]}'
+        clients = options['clients']
+        orders_per_client = options['orders_per_client']
+        items_per_order = min(options['items_per_order'], options['products'])
+
+        category = Category.objects.create(title=tag)
+        products = Product.objects.bulk_create([
+            Product(name=f'{tag} {i}', slug=tag, category=category, description='', unit_price=1,
+                    inventory=options['inventory'])
+            for i in range(options['products'])
+        ])
+        products = list(Product.objects.filter(category=category).order_by('id'))
+        user_model = get_user_model()
+        users = [user_model.objects.create(username=f'{tag}-{i}', email=f'{tag}-{i}@example.com') for i in range(clients)]
+        # Created for each new user by store.signals.handlers.
+        customer_ids = dict(Customer.objects.filter(user__in=users).values_list('user_id', 'pk'))
+
+        carts = {}
+        for client, user in enumerate(users):
+            carts[user.id] = []
+            for number in range(orders_per_client):
+                cart = Cart.objects.create()
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product=products[(client + number + offset) % len(products)], quantity=1)
+                    for offset in range(items_per_order)
+                ])
+                carts[user.id].append(cart.id)
+
+        results = {'ok': 0, 'out_of_stock': 0, 'errors': 0}
+        latencies = []
+        # Exceptions that killed a client thread.
+        failures = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients)
+
+        def client(user_id):
+            barrier.wait()
+            try:
+                for cart_id in carts[user_id]:
+                    start = time.perf_counter()
+                    serializer = OrderCreateSerializer(data={'cart_id': cart_id}, context={'customer_id': customer_ids[user_id]})
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save()
+                        outcome = 'ok'
+                    except serializers.ValidationError:
+                        outcome = 'out_of_stock'
+                    except OperationalError:
+                        outcome = 'errors'
+                    with lock:
+                        results[outcome] += 1
+                        latencies.append(time.perf_counter() - start)
+            except Exception as error:
+                with lock:
+                    failures.append(f'{type(error).__name__}: {error}')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(user.id,)) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        sold = dict(
+            OrderItem.objects.filter(product__in=products).values_list('product').annotate(sold=Sum('quantity'))
+        )
+        oversold = []
+        for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+            if product.inventory < 0 or product.inventory + sold.get(product.pk, 0) != options['inventory']:
+                oversold.append(product.pk)
+
+        stats = summarize(latencies)
+        self.stdout.write(
+            f"{clients} clients: {results['ok']} orders, {results['out_of_stock']} rejected as out of stock, "
+            f"{results['errors']} errors in {elapsed:.2f}s -> {results['ok'] / elapsed:.1f} orders/sec "
+            f"(p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms)"
+        )
+
+        if not options['keep']:
+            orders = Order.objects.filter(customer__user__in=users)
+            OrderItem.objects.filter(order__in=orders).delete()
+            orders.delete()
+            Cart.objects.filter(pk__in=[cart_id for cart_ids in carts.values() for cart_id in cart_ids]).delete()
+            Product.objects.filter(category=category).delete()
+            category.delete()
+            Customer.objects.filter(user__in=users).delete()
+            user_model.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if failures:
+            raise CommandError(f'{len(failures)} client threads died, e.g. {failures[0]}')
+        if not results['ok']:
+            raise CommandError('No orders were placed')
+        if oversold:
+            raise CommandError(f'Inventory is inconsistent for products {oversold}')
+        self.stdout.write('No overselling detected.')
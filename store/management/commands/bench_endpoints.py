@@ -0,0 +1,263 @@
+import json
+import random
+import tempfile
+from pathlib import Path
+
+import factory.random
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.metrics import QueryCounter
+from store import factories, search
+from store import urls as store_urls
+from store.benchmark import measure, summarize
+from store.models import Comment
+
+
+# Seeded rows per --scale.
+BASE_SIZES = {
+    'categories': 10,
+    'products': 200,
+    'customers': 20,
+    'orders': 100,
+    'comments': 400,
+    'carts': 20,
+}
+ITEMS_PER_ORDER = 3
+ITEMS_PER_CART = 3
+
+
+class Command(BaseCommand):
+    help = "Benchmarks every store route on a throwaway test database and compares with a saved baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help='Multiplier for the seeded dataset')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--cache', action='store_true', help='Keep the response cache on (off by default)')
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to compare the results with')
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help='Allowed relative p95 latency increase before flagging a regression')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Latency increases smaller than this are ignored as noise')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline: {e}')
+
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as tmp, override_settings(**self.get_settings(tmp, options)):
+                search.reset_product_index()
+                objects = self.seed(options['scale'], options['seed'])
+                search.load_product_index()
+                results = self.run(objects, options)
+                search.reset_product_index()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(timespec='seconds'),
+                'vendor': connection.vendor,
+                'scale': options['scale'],
+                'repeat': options['repeat'],
+                'cache': options['cache'],
+            },
+            'endpoints': results,
+        }
+        self.print_results(results)
+
+        if options['save']:
+            Path(options['save']).write_text(json.dumps(report, indent=2, sort_keys=True))
+            self.stdout.write(f"Saved results to {options['save']}")
+
+        # Timing error responses would benchmark the wrong code path.
+        failed = [name for name, result in results.items() if any(not 200 <= code < 300 for code in result['status'])]
+        if failed:
+            raise CommandError(f"Non-2xx responses from: {', '.join(failed)}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, report, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(line)
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def get_settings(self, tmp, options):
+        overrides = {
+            # Never reuse the on-disk search snapshot, it indexes another database.
+            'PRODUCT_SEARCH_INDEX_PATH': Path(tmp) / 'product_search_index.pickle',
+            'QUERY_BUDGET_ACTION': 'log',
+        }
+        if not options['cache']:
+            overrides['CACHES'] = {
+                **settings.CACHES,
+                'bench': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            }
+            overrides['STORE_RESPONSE_CACHE_ALIAS'] = 'bench'
+        return overrides
+
+    def seed(self, scale, seed):
+        random.seed(seed)
+        factory.random.reseed_random(seed)
+        factories.faker.seed_instance(seed)
+        sizes = {name: size * scale for name, size in BASE_SIZES.items()}
+
+        categories = factories.CategoryFactory.create_batch(sizes['categories'])
+        products = [
+            factories.ProductFactory(category=random.choice(categories), slug=f'product-{index}')
+            for index in range(sizes['products'])
+        ]
+        discounts = factories.DiscountFactory.create_batch(5)
+        for product in products[::10]:
+            product.discounts.add(random.choice(discounts))
+        customers = factories.CustomerFactory.create_batch(sizes['customers'])
+        comments = [
+            factories.CommentFactory(product=random.choice(products[:sizes['products'] // 4]))
+            for _ in range(sizes['comments'])
+        ]
+        # The public comment routes only serve approved comments.
+        approved = factories.CommentFactory(product=products[0], status=Comment.COMMENT_STATUS_APPROVED)
+
+        orders = []
+        for _ in range(sizes['orders']):
+            order = factories.OrderFactory(customer=random.choice(customers))
+            for product in random.sample(products, ITEMS_PER_ORDER):
+                factories.OrderItemFactory(order=order, product=product, unit_price=product.unit_price)
+            orders.append(order)
+
+        carts = factories.CartFactory.create_batch(sizes['carts'])
+        for cart in carts:
+            for product in random.sample(products, ITEMS_PER_CART):
+                factories.CartItemFactory(cart=cart, product=product)
+
+        staff = factories.UserFactory(username='bench-staff', is_staff=True, is_superuser=True)
+        comment = approved
+        cart = carts[0]
+        order = orders[0]
+        return {
+            'staff': staff,
+            'product': comment.product,
+            'category': comment.product.category,
+            'comment': comment,
+            'cart': cart,
+            'cart_item': cart.items.first(),
+            'customer': customers[0],
+            'order': order,
+            'order_item': order.items.first(),
+        }
+
+    def get_endpoints(self, objects):
+        """(name, method, url, data) for every GET route in store.urls, plus a few writes."""
+        kwargs_values = {
+            'product_pk': objects['product'].pk,
+            'cart_pk': objects['cart'].pk,
+            'order_pk': objects['order'].pk,
+        }
+        detail_pks = {
+            'product': objects['product'].pk,
+            'async-product': objects['product'].pk,
+            'category': objects['category'].pk,
+            'comment': objects['comment'].pk,
+            'comment-product': objects['comment'].pk,
+            'carts': objects['cart'].pk,
+            'cart-items': objects['cart_item'].pk,
+            'customer': objects['customer'].pk,
+            'orders': objects['order'].pk,
+            'order-items': objects['order_item'].pk,
+        }
+        endpoints = []
+        for pattern in store_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or not pattern.name:
+                continue
+            names = set(pattern.pattern.regex.groupindex)
+            if 'format' in names:
+                continue
+            actions = getattr(pattern.callback, 'actions', None)
+            if actions is not None and 'get' not in actions:
+                continue
+            kwargs = {name: kwargs_values[name] for name in names if name != 'pk'}
+            if 'pk' in names:
+                # Longest basename first, so `comment-product-detail` doesn't match `comment`.
+                basename = next(basename for basename in sorted(detail_pks, key=len, reverse=True)
+                                if pattern.name.startswith(basename + '-'))
+                kwargs['pk'] = detail_pks[basename]
+            endpoints.append((pattern.name, 'get', reverse(pattern.name, kwargs=kwargs), None))
+
+        endpoints += [
+            ('carts-list', 'post', reverse('carts-list'), {}),
+            ('cart-items-list', 'post', reverse('cart-items-list', kwargs={'cart_pk': objects['cart'].pk}),
+             {'product': objects['product'].pk, 'quantity': 1}),
+        ]
+        return sorted(endpoints)
+
+    def run(self, objects, options):
+        client = APIClient()
+        client.force_authenticate(objects['staff'])
+        results = {}
+        for name, method, url, data in self.get_endpoints(objects):
+            counter = QueryCounter()
+            statuses = set()
+            query_counts = []
+
+            def request():
+                before = counter.count
+                with connection.execute_wrapper(counter):
+                    response = getattr(client, method)(url, data, format='json' if data is not None else None)
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                query_counts.append(counter.count - before)
+                statuses.add(response.status_code)
+
+            samples = measure(request, repeat=options['repeat'], warmup=options['warmup'])
+            query_counts = query_counts[options['warmup']:]
+            results[f'{method.upper()} {name}'] = {
+                'url': url,
+                'status': sorted(statuses),
+                'queries': max(query_counts),
+                'queries_min': min(query_counts),
+                **summarize(samples),
+            }
+        return results
+
+    def print_results(self, results):
+        self.stdout.write(f"{'endpoint':<40} {'status':>8} {'queries':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for name, result in results.items():
+            status = ','.join(str(code) for code in result['status'])
+            self.stdout.write(
+                f"{name:<40} {status:>8} {result['queries']:>8} {result['p50_ms']:>7.2f}ms "
+                f"{result['p95_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms"
+            )
+
+    @staticmethod
+    def compare(baseline, report, threshold, min_delta_ms):
+        regressions = []
+        for name, result in report['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(name)
+            if previous is None:
+                continue
+            if result['queries'] > previous['queries']:
+                regressions.append(f"{name}: {previous['queries']} -> {result['queries']} queries")
+            delta = result['p95_ms'] - previous['p95_ms']
+            if delta > min_delta_ms and result['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {result['p95_ms']}ms")
+            if result['status'] != previous['status']:
+                regressions.append(f"{name}: status {previous['status']} -> {result['status']}")
+        return regressions
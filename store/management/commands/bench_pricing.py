@@ -0,0 +1,101 @@
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+import factory.random
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from store import factories, pricing
+from store.benchmark import measure, summarize
+from store.models import Discount, Product
+
+
+DISCOUNTS = 20
+
+
+def naive_prices(products, tax_rate):
+    """The same prices computed one product at a time, with a discounts query each."""
+    prices = {}
+    for product in products:
+        best = max((discount.discount for discount in product.discounts.all()), default=0)
+        discounted = (product.unit_price * (1 - Decimal(str(best)))).quantize(pricing.CENT, ROUND_HALF_UP)
+        after_tax = (discounted * (1 + tax_rate)).quantize(pricing.CENT, ROUND_HALF_UP)
+        prices[product.pk] = (discounted, after_tax)
+    return prices
+
+
+class Command(BaseCommand):
+    help = "Compares per-product pricing with store.pricing.get_prices(), on a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = max(options['batch_sizes'])
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(rows, options['seed'])
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self, rows, seed):
+        random.seed(seed)
+        factory.random.reseed_random(seed)
+        factories.faker.seed_instance(seed)
+        categories = factories.CategoryFactory.create_batch(10)
+        Product.objects.bulk_create([
+            factories.ProductFactory.build(category=random.choice(categories)) for _ in range(rows)
+        ])
+        discounts = Discount.objects.bulk_create([
+            Discount(discount=random.choice([0.05, 0.1, 0.15, 0.2, 0.25, 0.3]), description=f'discount {i}')
+            for i in range(DISCOUNTS)
+        ])
+        Through = Product.discounts.through
+        Through.objects.bulk_create([
+            Through(product_id=pk, discount_id=discount.pk)
+            for pk in Product.objects.values_list('pk', flat=True)
+            for discount in random.sample(discounts, random.randint(0, 3))
+        ])
+
+    def run(self, options):
+        tax_rate = pricing.get_tax_rate()
+        self.stdout.write(
+            f"{'products':>8} {'naive p50':>11} {'queries':>8} {'batch p50':>11} {'queries':>8} "
+            f"{'products/s':>11} {'speedup':>8}"
+        )
+        for size in options['batch_sizes']:
+            products = list(Product.objects.order_by('pk')[:size])
+
+            def naive():
+                return naive_prices(products, tax_rate)
+
+            def batch():
+                return pricing.get_prices(products, tax_rate)
+
+            with CaptureQueriesContext(connection) as naive_queries:
+                expected = naive()
+            with CaptureQueriesContext(connection) as batch_queries:
+                actual = batch()
+            self.compare(expected, actual)
+
+            slow_stats = summarize(measure(naive, repeat=options['repeat']))
+            fast_stats = summarize(measure(batch, repeat=options['repeat']))
+            throughput = size / fast_stats['p50_ms'] * 1000 if fast_stats['p50_ms'] else 0
+            speedup = slow_stats['p50_ms'] / fast_stats['p50_ms'] if fast_stats['p50_ms'] else 0
+            self.stdout.write(
+                f"{size:>8} {slow_stats['p50_ms']:>9.2f}ms {len(naive_queries):>8} "
+                f"{fast_stats['p50_ms']:>9.2f}ms {len(batch_queries):>8} {throughput:>11.0f} {speedup:>7.1f}x"
+            )
+
+    def compare(self, expected, actual):
+        for pk, (discounted, after_tax) in expected.items():
+            price = actual[pk]
+            if (price.discounted, price.after_tax) != (discounted, after_tax):
+                raise CommandError(f'product {pk}: {price} does not match {discounted} / {after_tax}')
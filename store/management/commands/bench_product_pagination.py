@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.benchmark import measure, summarize
+from store.models import Product
+from store.paginations import DefaultProductPagination, ProductKeysetPagination
+
+
+class Command(BaseCommand):
+    help = "Compares page-number and keyset pagination latency on /store/products/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10000])
+        parser.add_argument('--ordering', default='id', choices=['id', 'name', '-name', 'inventory', '-inventory'])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.order_by(options['ordering'])
+        factory = APIRequestFactory()
+        page_size = DefaultProductPagination.page_size
+
+        for page in options['pages']:
+            offset = (page - 1) * page_size
+            if offset and not queryset[offset - 1:offset].exists():
+                raise CommandError(f'Page {page} is past the end of the catalog, generate more products first.')
+
+            offset_request = Request(factory.get('/store/products/', {'page': page}))
+            keyset_params = {'pagination': 'cursor'}
+            if offset:
+                keyset = ProductKeysetPagination()
+                keyset.model, keyset.ordering = Product, keyset.get_ordering(queryset)
+                keyset_params['cursor'] = keyset.get_cursor_token(queryset[offset - 1])
+            keyset_request = Request(factory.get('/store/products/', keyset_params))
+
+            def offset_page():
+                DefaultProductPagination().paginate_queryset(queryset, offset_request)
+
+            def keyset_page():
+                ProductKeysetPagination().paginate_queryset(queryset, keyset_request)
+
+            for name, func in [('page-number', offset_page), ('keyset', keyset_page)]:
+                stats = summarize(measure(func, repeat=options['repeat']))
+                self.stdout.write(
+                    f"page {page:>7} {name:<12} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms max={stats['max_ms']}ms"
+                )
@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.benchmark import measure, summarize
+from store.filters import ProductSearchFilter
+from store.models import Product
+from store.search import ProductSearchIndex, get_index_path
+from store import search
+
+
+class IcontainsView:
+    search_fields = ['name', 'description', 'category__title']
+
+
+class Command(BaseCommand):
+    help = "Compares the BM25 search index with the icontains SearchFilter on the product catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', nargs='+', help='Queries to run (defaults to words sampled from product names)')
+        parser.add_argument('--samples', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('There are no products, run setup_fake_data first.')
+
+        queries = options['queries']
+        if not queries:
+            rng = random.Random(options['seed'])
+            names = Product.objects.order_by('?').values_list('name', flat=True)[:options['samples']]
+            queries = [rng.choice(name.split()) for name in names if name.split()]
+            # Search-as-you-type: also time a few prefixes.
+            queries += [query[:3] for query in queries[:5] if len(query) > 3]
+
+        start = time.perf_counter()
+        try:
+            index = ProductSearchIndex.load(get_index_path())
+            index.refresh(since=index.built_at)
+            source = 'snapshot'
+        except FileNotFoundError:
+            index = ProductSearchIndex.build()
+            source = 'database'
+        self.stdout.write(f"Loaded index for {len(index)} products from {source} in {time.perf_counter() - start:.1f}s")
+        search._index = index
+
+        factory = APIRequestFactory()
+        page_size = options['page_size']
+        results = {'icontains': [], 'bm25': []}
+        for query in queries:
+            request = Request(factory.get('/store/products/', {'search': query}))
+
+            def icontains():
+                list(SearchFilter().filter_queryset(request, Product.objects.all(), IcontainsView)[:page_size])
+
+            def bm25():
+                list(ProductSearchFilter().filter_queryset(request, Product.objects.all(), None)[:page_size])
+
+            results['icontains'] += measure(icontains, repeat=options['repeat'])
+            results['bm25'] += measure(bm25, repeat=options['repeat'])
+
+        for name, samples in results.items():
+            stats = summarize(samples)
+            self.stdout.write(
+                f"{name:<10} queries={len(queries)} p50={stats['p50_ms']}ms "
+                f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms"
+            )
@@ -0,0 +1,93 @@
+import random
+
+import factory.random
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from rest_framework.renderers import JSONRenderer
+
+from store import factories
+from store.benchmark import measure, summarize
+from store.compiled import compile_serializer
+from store.models import Order, OrderItem, Product
+from store.renderers import ORJSONRenderer
+from store.serializers import OrderAdminSerializer, ProductSerializer
+
+
+ITEMS_PER_ORDER = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares DRF serializers + JSONRenderer with compiled serializers + ORJSONRenderer "
+        "for product and order pages, on a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = max(options['page_sizes'])
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(rows, options['seed'])
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self, rows, seed):
+        random.seed(seed)
+        factory.random.reseed_random(seed)
+        factories.faker.seed_instance(seed)
+        categories = factories.CategoryFactory.create_batch(10)
+        Product.objects.bulk_create([
+            factories.ProductFactory.build(category=random.choice(categories)) for _ in range(rows)
+        ])
+        products = list(Product.objects.all())
+        customers = factories.CustomerFactory.create_batch(20)
+        orders = Order.objects.bulk_create([
+            factories.OrderFactory.build(customer=random.choice(customers)) for _ in range(rows)
+        ])
+        OrderItem.objects.bulk_create([
+            factories.OrderItemFactory.build(order=order, product=product, unit_price=product.unit_price)
+            for order in orders for product in random.sample(products, ITEMS_PER_ORDER)
+        ])
+
+    def get_targets(self):
+        orders = Order.objects.prefetch_related(
+            Prefetch('items', OrderItem.objects.select_related('product'))
+        ).select_related('customer__user').order_by('pk')
+        return [
+            ('products', ProductSerializer, Product.objects.order_by('pk')),
+            ('orders', OrderAdminSerializer, orders),
+        ]
+
+    def run(self, options):
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+        self.stdout.write(f"{'target':<10} {'rows':>6} {'drf p50':>11} {'compiled p50':>13} {'speedup':>8}  same bytes")
+        for name, serializer_class, queryset in self.get_targets():
+            compiled = compile_serializer(serializer_class)
+            for size in options['page_sizes']:
+                def drf():
+                    return json_renderer.render(serializer_class(list(queryset[:size]), many=True).data)
+
+                def fast():
+                    return orjson_renderer.render(compiled.serialize(compiled.prepare(queryset)[:size]))
+
+                same = drf() == fast()
+                if not same:
+                    raise CommandError(f'{name} x {size}: compiled output differs from DRF output')
+                slow_stats = summarize(measure(drf, repeat=options['repeat']))
+                fast_stats = summarize(measure(fast, repeat=options['repeat']))
+                speedup = slow_stats['p50_ms'] / fast_stats['p50_ms'] if fast_stats['p50_ms'] else 0
+                self.stdout.write(
+                    f"{name:<10} {size:>6} {slow_stats['p50_ms']:>9.2f}ms {fast_stats['p50_ms']:>11.2f}ms "
+                    f"{speedup:>7.1f}x  {same}"
+                )
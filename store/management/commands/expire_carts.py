@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Deletes carts (and their items) untouched for --days, in small primary-key-ordered batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=30, help='Expire carts untouched for this many days')
+        parser.add_argument('--batch-size', type=int, default=200, help='Carts deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches')
+        parser.add_argument('--limit', type=int, help='Stop after this many carts')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        limit = options['limit']
+        carts = items = 0
+        after = None
+        start = time.perf_counter()
+        while limit is None or carts < limit:
+            size = options['batch_size'] if limit is None else min(options['batch_size'], limit - carts)
+            after, deleted_carts, deleted_items = Cart.objects.delete_expired(cutoff, size, after)
+            if after is None:
+                break
+            carts += deleted_carts
+            items += deleted_items
+            if options['pause']:
+                time.sleep(options['pause'])
+        elapsed = time.perf_counter() - start
+        rate = (carts + items) / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Deleted {carts} carts and {items} cart items untouched since {cutoff:%Y-%m-%d %H:%M} "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        )
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bulk import FORMATS, export_orders
+from store.filters import OrderFilterSet
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = "Streams orders and their items as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=FORMATS, default='csv')
+        parser.add_argument('--status', choices=[choice for choice, _ in Order.ORDER_STATUS])
+        parser.add_argument('--created-after', help='e.g. 2024-01-01')
+        parser.add_argument('--created-before')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in ('status', 'created_after', 'created_before') if options[name]}
+        filterset = OrderFilterSet(params, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in export_orders(filterset.qs, options['type'], chunk_size=options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
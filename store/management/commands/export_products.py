@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from store.bulk import FORMATS, export_products
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Streams the product catalog as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in export_products(Product.objects.all(), options['type'], chunk_size=options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
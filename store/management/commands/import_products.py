@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bulk import FORMATS, ProductImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Creates or updates products from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=FORMATS, help='File format (guessed from the extension by default)')
+        parser.add_argument('--key', choices=['slug', 'id'], default='slug')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--atomic', action='store_true', help='Save nothing if any row fails')
+
+    def handle(self, *args, **options):
+        file_format = options['type'] or guess_format(options['path'])
+        importer = ProductImporter(key=options['key'], chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+                                   atomic=options['atomic'])
+        try:
+            with open(options['path'], 'rb') as file:
+                report = importer.run(read_rows(file, file_format))
+        except OSError as error:
+            raise CommandError(error)
+
+        for error in report['errors']:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"{report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, {report['failed']} failed"
+            + (' (dry run)' if options['dry_run'] else '')
+            + (' (rolled back)' if report['rolled_back'] else '')
+        )
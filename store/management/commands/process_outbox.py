@@ -0,0 +1,68 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store import outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers outbox events (e.g. order.created) to their signal receivers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads delivering events')
+        parser.add_argument('--lease', type=int, default=60,
+                            help='Seconds a claimed batch stays reserved for this worker')
+        parser.add_argument('--max-attempts', type=int, default=10)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when there is nothing to deliver')
+        parser.add_argument('--report-interval', type=float, default=60.0)
+        parser.add_argument('--retention-days', type=int, default=7,
+                            help='Delivered events older than this are deleted')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Outbox worker {worker} started')
+        total_done = total_failed = 0
+        window_done, window_start = 0, time.monotonic()
+        last_purge = 0.0
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            try:
+                while True:
+                    done, failed = outbox.process_batch(
+                        worker, executor, batch_size=options['batch_size'],
+                        lease_seconds=options['lease'], max_attempts=options['max_attempts'],
+                    )
+                    total_done += done
+                    total_failed += failed
+                    window_done += done
+
+                    elapsed = time.monotonic() - window_start
+                    if elapsed >= options['report_interval']:
+                        self.report(window_done / elapsed, total_done, total_failed)
+                        window_done, window_start = 0, time.monotonic()
+                    if time.monotonic() - last_purge > 3600:
+                        outbox.purge(options['retention_days'])
+                        last_purge = time.monotonic()
+
+                    if done + failed == 0:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+
+        elapsed = time.monotonic() - window_start
+        self.report(window_done / elapsed if elapsed else 0.0, total_done, total_failed)
+
+    def report(self, rate, done, failed):
+        stats = outbox.get_stats()
+        self.stdout.write(
+            f"delivered={done} failed={failed} rate={rate:.1f}/s "
+            f"pending={stats['pending']} lag={stats['lag_seconds']:.1f}s"
+        )
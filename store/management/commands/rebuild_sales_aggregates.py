@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import sales
+
+
+class Command(BaseCommand):
+    help = "Recomputes the daily product and category sales aggregates from the order tables"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = sales.rebuild()
+        self.stdout.write(f"Rebuilt {rows} product-day rows in {time.perf_counter() - start:.1f}s")
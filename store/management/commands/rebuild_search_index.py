@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.search import ProductSearchIndex, get_index_path
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the product search index snapshot from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Where to write the snapshot (defaults to PRODUCT_SEARCH_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_index_path()
+        start = time.perf_counter()
+        index = ProductSearchIndex.build()
+        index.save(path)
+        self.stdout.write(
+            f"Indexed {len(index)} products ({len(index.postings)} terms) "
+            f"in {time.perf_counter() - start:.1f}s -> {path}"
+        )
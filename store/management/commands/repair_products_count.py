@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from store.models import Category
+
+
+class Command(BaseCommand):
+    help = "Recomputes Category.products_count from the product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the categories that drifted')
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Category.objects.annotate(actual=Count('products')).exclude(products_count=F('actual'))
+            .values_list('id', 'products_count', 'actual')
+        )
+        for category_id, stored, actual in drifted:
+            self.stdout.write(f"Category {category_id}: stored {stored}, actual {actual}")
+
+        if drifted and not options['dry_run']:
+            Category.objects.filter(pk__in=[row[0] for row in drifted]).recount_products()
+        self.stdout.write(f"{len(drifted)} categories {'drifted' if options['dry_run'] else 'repaired'}.")
@@ -1,125 +1,345 @@
-# setup_test_data.py
 import random
-from faker import Faker
+import time
+import uuid
+from array import array
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from decimal import Decimal
+from multiprocessing import Pool
 
-from django.db import transaction
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from faker.providers.lorem.en_US import Provider as LoremProvider
+from faker.providers.person.en_US import Provider as PersonProvider
 
-from store.models import Address, Cart, CartItem, Category, Comment, Order, OrderItem, Product, Discount, Customer
-from store.factories import (
-    CartFactory,
-    CategoryFactory,
-    CommentFactory,
-    OrderItemFactory,
-    ProductFactory,
-    DiscountFactory,
-    CustomerFactory,
-    AddressFactory,
-    OrderFactory,
-    CartItemFactory,
-)
+from store.models import (Address, ArchivedOrder, Cart, CartItem, Category, CategoryDailySales, Comment, Order,
+                          OrderItem, OutboxEvent, Product, ProductDailySales, Discount, Customer)
 
-faker = Faker()
-
-list_of_models = [CartItem, Cart, OrderItem, Order, Product, Category, Comment, Discount, Address, Customer]
 
+# Sizes at --scale 1. Categories and discounts are lookup tables and do not scale.
 NUM_CATEGORIES = 100
 NUM_DISCOUNTS = 10
 NUM_PRODUCTS = 1000
 NUM_CUSTOMERS = 100
-NUM_ORDERS = 30
+NUM_ORDERS = 1000
 NUM_CARTS = 100
+MAX_ITEMS_PER_ORDER = 9
+MAX_COMMENTS_PER_PRODUCT = 5
+MAX_ITEMS_PER_CART = 10
+
+FAKE_USERNAME_PREFIX = 'fake_'
+
+WORDS = LoremProvider.word_list
+FIRST_NAMES = list(PersonProvider.first_names)
+LAST_NAMES = list(PersonProvider.last_names)
+
+PRODUCTS_CREATED = (datetime(2022, 1, 1), datetime(2023, 1, 1))
+ORDERS_CREATED = (datetime(2022, 6, 1), datetime(2023, 1, 1))
+COMMENTS_CREATED = (datetime(2015, 1, 1), datetime(2023, 1, 1))
+
+list_of_models = [
+    ProductDailySales, CategoryDailySales, OutboxEvent, CartItem, Cart, OrderItem, Order, ArchivedOrder, Comment,
+    Product.discounts.through, Product, Category, Discount,
+]
+
+
+def chunk_random(seed, table, index):
+    # String seeds are hashed with SHA-512, so chunks are reproducible across processes and runs.
+    return random.Random(f'{seed}:{table}:{index}')
+
+
+def random_datetime(rng, start, end):
+    return start + timedelta(seconds=rng.randrange(int((end - start).total_seconds())))
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_products(task):
+    seed, index, first_id, count, category_ids = task
+    rng = chunk_random(seed, 'products', index)
+    rows = []
+    for product_id in range(first_id, first_id + count):
+        name = ' '.join(rng.choice(WORDS).capitalize() for _ in range(3))
+        created = random_datetime(rng, *PRODUCTS_CREATED)
+        rows.append((
+            product_id,
+            name,
+            '-'.join(name.split(' ')).lower(),
+            ' '.join(sentence(rng, rng.randint(6, 12)) for _ in range(rng.randint(1, 5))),
+            rng.randint(100, 100000),
+            rng.randint(1, 100),
+            rng.choice(category_ids),
+            created,
+            created + timedelta(hours=rng.randint(1, 5000)),
+        ))
+    return rows
+
+
+def generate_customers(task):
+    seed, index, first_user_id, first_customer_id, count = task
+    rng = chunk_random(seed, 'customers', index)
+    rows = []
+    for offset in range(count):
+        user_id = first_user_id + offset
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        rows.append((
+            user_id,
+            first_customer_id + offset,
+            first_name,
+            last_name,
+            f'{FAKE_USERNAME_PREFIX}{user_id}',
+            f'{first_name}.{last_name}.{user_id}@example.com'.lower(),
+            f'+1-{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            random_datetime(rng, datetime(1960, 1, 1), datetime(2005, 1, 1)).date(),
+            rng.choice(WORDS),
+            rng.choice(WORDS),
+            f'street {rng.randint(1, 50)}',
+        ))
+    return rows
+
+
+def generate_orders(task):
+    seed, index, first_id, count, customer_ids, first_product_id, product_count = task
+    rng = chunk_random(seed, 'orders', index)
+    statuses = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_UNPAID, Order.ORDER_STATUS_CANCELED]
+    orders, items = [], []
+    for order_id in range(first_id, first_id + count):
+        orders.append((order_id, rng.choice(customer_ids), random_datetime(rng, *ORDERS_CREATED), rng.choice(statuses)))
+        for position in rng.sample(range(product_count), rng.randint(1, min(MAX_ITEMS_PER_ORDER, product_count))):
+            items.append((order_id, first_product_id + position, rng.randint(1, 20)))
+    return orders, items
+
+
+def generate_comments(task):
+    seed, index, first_product_id, count = task
+    rng = chunk_random(seed, 'comments', index)
+    statuses = [Comment.COMMENT_STATUS_WAITING, Comment.COMMENT_STATUS_APPROVED, Comment.COMMENT_STATUS_NOT_APPROVED]
+    rows = []
+    for product_id in range(first_product_id, first_product_id + count):
+        for _ in range(rng.randint(1, MAX_COMMENTS_PER_PRODUCT)):
+            rows.append((
+                product_id,
+                rng.choice(FIRST_NAMES),
+                ' '.join(sentence(rng, rng.randint(5, 12)) for _ in range(rng.randint(1, 3))),
+                random_datetime(rng, *COMMENTS_CREATED),
+                rng.choice(statuses),
+            ))
+    return rows
+
+
+def generate_carts(task):
+    seed, index, count, first_product_id, product_count = task
+    rng = chunk_random(seed, 'carts', index)
+    carts, items = [], []
+    for _ in range(count):
+        cart_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        carts.append(cart_id)
+        for position in rng.sample(range(product_count), rng.randint(1, min(MAX_ITEMS_PER_CART, product_count))):
+            items.append((cart_id, first_product_id + position, rng.randint(1, 20)))
+    return carts, items
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """Let bulk_create write generated datetime_created values instead of now()."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
 
 class Command(BaseCommand):
     help = "Generates fake data"
 
-    @transaction.atomic
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help=f'Multiplies the dataset size; 1 means {NUM_PRODUCTS} products and {NUM_ORDERS} orders')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed and scale always produce the same data')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1, help='Processes used to generate rows')
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        scale = options['scale']
+        sizes = {
+            'products': max(1, int(NUM_PRODUCTS * scale)),
+            'customers': max(1, int(NUM_CUSTOMERS * scale)),
+            'orders': int(NUM_ORDERS * scale),
+            'carts': int(NUM_CARTS * scale),
+        }
+
         self.stdout.write("Deleting old data...")
-        models = list_of_models
-        for m in models:
-            m.objects.all().delete()
+        self.delete_old_data()
 
         self.stdout.write("Creating new data...\n")
+        started = time.perf_counter()
+        self.pool = Pool(options['workers']) if options['workers'] > 1 else None
+        try:
+            with keep_timestamps(Product, Order, Comment):
+                self.create_data(sizes)
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+        self.reset_sequences()
+        self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s")
+
+    def delete_old_data(self):
+        user_model = get_user_model()
+        fake_users = user_model.objects.filter(username__startswith=FAKE_USERNAME_PREFIX)
+        with transaction.atomic(), connection.cursor() as cursor:
+            Category.objects.update(top_product=None)
+            # Plain DELETEs: the ORM collector would load every row to cascade and send signals.
+            for model in list_of_models:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+            Address.objects.filter(customer__user__in=fake_users).delete()
+            Customer.objects.filter(user__in=fake_users).delete()
+            fake_users.delete()
+
+    def chunks(self, total):
+        for index, start in enumerate(range(0, total, self.batch_size)):
+            yield index, start, min(self.batch_size, total - start)
+
+    def generate(self, func, tasks):
+        if self.pool is None:
+            return map(func, tasks)
+        return self.pool.imap(func, tasks)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Adding {count} {label}... DONE ({elapsed:.1f}s, {count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def create_data(self, sizes):
+        batch_size = self.batch_size
+        rng = chunk_random(self.seed, 'lookups', 0)
 
         # Categories data
-        print(f"Adding {NUM_CATEGORIES} categories...", end='')
-        all_categories = [CategoryFactory(top_product=None) for _ in range(NUM_CATEGORIES)]
-        print('DONE')
-        
+        started = time.perf_counter()
+        Category.objects.bulk_create([
+            Category(title=sentence(rng, rng.randint(3, 5))[:-1], description=sentence(rng, 10))
+            for _ in range(NUM_CATEGORIES)
+        ])
+        category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        self.report('categories', NUM_CATEGORIES, started)
+
         # Discounts data
-        print(f"Adding {NUM_DISCOUNTS} discounts...", end='')
-        all_discounts = [DiscountFactory() for _ in range(NUM_DISCOUNTS)]
-        print('DONE')
+        started = time.perf_counter()
+        Discount.objects.bulk_create([
+            Discount(discount=rng.randint(1, 80) / 100, description=sentence(rng, 8)) for _ in range(NUM_DISCOUNTS)
+        ])
+        self.report('discounts', NUM_DISCOUNTS, started)
 
         # Products data
-        print(f"Adding {NUM_PRODUCTS} product...", end='')
-        all_products = list()
-        for _ in range(NUM_PRODUCTS):
-            new_product = ProductFactory(category_id=random.choice(all_categories).id)
-            new_product.datetime_created = faker.date_time_ad(start_datetime=datetime(2022,1,1), end_datetime=datetime(2023,1,1))
-            new_product.datetime_modified = new_product.datetime_created + timedelta(hours=random.randint(1, 5000))
-            all_products.append(new_product)
-        print('DONE')
-
-        # Customers data
-        print(f"Adding {NUM_CUSTOMERS} customers...", end='')
-        all_customers = [CustomerFactory() for _ in range(NUM_CUSTOMERS)]
-        print('DONE')
-
-        # Addresses data
-        print(f"Adding customers addresses...", end='')
-        all_addresses = [
-            AddressFactory(customer_id=customer.id) for customer in all_customers
+        started = time.perf_counter()
+        first_product_id = next_id(Product)
+        prices = array('l')
+        tasks = [
+            (self.seed, index, first_product_id + start, count, category_ids)
+            for index, start, count in self.chunks(sizes['products'])
+        ]
+        for rows in self.generate(generate_products, tasks):
+            Product.objects.bulk_create([
+                Product(id=row[0], name=row[1], slug=row[2][:50], description=row[3],
+                        unit_price=Decimal(row[4]) / 100, inventory=row[5], category_id=row[6],
+                        datetime_created=row[7], datetime_modified=row[8])
+                for row in rows
+            ], batch_size=batch_size)
+            prices.extend(row[4] for row in rows)
+        self.report('products', sizes['products'], started)
+
+        # Customers and addresses data
+        started = time.perf_counter()
+        user_model = get_user_model()
+        first_user_id, first_customer_id = next_id(user_model), next_id(Customer)
+        tasks = [
+            (self.seed, index, first_user_id + start, first_customer_id + start, count)
+            for index, start, count in self.chunks(sizes['customers'])
+        ]
+        for rows in self.generate(generate_customers, tasks):
+            # Bulk inserts skip the post_save handler that creates customers, so they are added explicitly.
+            user_model.objects.bulk_create([
+                user_model(id=row[0], first_name=row[2], last_name=row[3], username=row[4], email=row[5], password='!')
+                for row in rows
+            ], batch_size=batch_size)
+            Customer.objects.bulk_create([
+                Customer(id=row[1], user_id=row[0], phone_number=row[6], birth_date=row[7]) for row in rows
+            ], batch_size=batch_size)
+            Address.objects.bulk_create([
+                Address(customer_id=row[1], province=row[8], city=row[9], street=row[10]) for row in rows
+            ], batch_size=batch_size)
+        customer_ids = list(range(first_customer_id, first_customer_id + sizes['customers']))
+        self.report('customers', sizes['customers'], started)
+
+        # Orders and order items data
+        started = time.perf_counter()
+        first_order_id = next_id(Order)
+        tasks = [
+            (self.seed, index, first_order_id + start, count, customer_ids, first_product_id, sizes['products'])
+            for index, start, count in self.chunks(sizes['orders'])
         ]
-        print('DONE')
-
-        # Orders data
-        print(f"Adding {NUM_ORDERS} orders...", end='')
-        all_orders = [OrderFactory(
-            customer_id=random.choice(all_customers).id
-        ) for _ in range(NUM_ORDERS)]
-        for order in all_orders:
-            order.datetime_created = faker.date_time_ad(start_datetime=datetime(2022,6,1), end_datetime=datetime(2023,1,1))
-        print('DONE')
-
-        # OrderItems data
-        print(f"Adding order items...", end='')
-        all_order_items = list()
-        for order in all_orders:
-            products = random.sample(all_products, random.randint(1, 10))
-            for product in products:
-                order_item = OrderItemFactory(
-                    order_id=order.id,
-                    product_id=product.id,
-                    unit_price=product.unit_price,
-                )
-                all_order_items.append(order_item)
-        print('DONE')
+        item_count = 0
+        for orders, items in self.generate(generate_orders, tasks):
+            Order.objects.bulk_create([
+                Order(id=row[0], customer_id=row[1], datetime_created=row[2], status=row[3]) for row in orders
+            ], batch_size=batch_size)
+            OrderItem.objects.bulk_create([
+                OrderItem(order_id=row[0], product_id=row[1], quantity=row[2],
+                          unit_price=Decimal(prices[row[1] - first_product_id]) / 100)
+                for row in items
+            ], batch_size=batch_size)
+            item_count += len(items)
+        self.report(f'orders with {item_count} items', sizes['orders'], started)
 
         # Comments data
-        print(f"Adding product comments...", end='')
-        for product in all_products:
-            for _ in range(random.randint(1, 5)):
-                comment = CommentFactory(product_id=product.id)
-                comment.datetime_created = faker.date_time_ad(start_datetime=datetime(2015,1,1), end_datetime=datetime(2023,1,1))
-        print('DONE')
-
-        # Carts data
-        print(f"Adding {NUM_CARTS} carts...", end='')
-        all_carts = [CartFactory() for _ in range(NUM_CARTS)]
-        print('DONE')
-
-        # CartItems data
-        print(f"Adding cart items...", end='')
-        all_cart_items = list()
-        for cart in all_carts:
-            products = random.sample(all_products, random.randint(1, 10))
-            for product in products:
-                cart_item = CartItemFactory(
-                    cart_id=cart.id,
-                    product_id=product.id,
-                )
-                all_cart_items.append(cart_item)
-        print('DONE')
+        started = time.perf_counter()
+        comment_count = 0
+        tasks = [
+            (self.seed, index, first_product_id + start, count)
+            for index, start, count in self.chunks(sizes['products'])
+        ]
+        for rows in self.generate(generate_comments, tasks):
+            Comment.objects.bulk_create([
+                Comment(product_id=row[0], name=row[1], body=row[2], datetime_created=row[3], status=row[4])
+                for row in rows
+            ], batch_size=batch_size)
+            comment_count += len(rows)
+        self.report('product comments', comment_count, started)
+
+        # Carts and cart items data
+        started = time.perf_counter()
+        tasks = [
+            (self.seed, index, count, first_product_id, sizes['products'])
+            for index, start, count in self.chunks(sizes['carts'])
+        ]
+        for carts, items in self.generate(generate_carts, tasks):
+            Cart.objects.bulk_create([Cart(id=cart_id) for cart_id in carts], batch_size=batch_size)
+            CartItem.objects.bulk_create([
+                CartItem(cart_id=row[0], product_id=row[1], quantity=row[2]) for row in items
+            ], batch_size=batch_size)
+        self.report('carts', sizes['carts'], started)
+
+    def reset_sequences(self):
+        # Rows were inserted with explicit ids; PostgreSQL sequences do not follow on their own.
+        sql = connection.ops.sequence_reset_sql(no_style(), [get_user_model(), Customer, Product, Order])
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
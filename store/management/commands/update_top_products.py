@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store import sales
+
+
+class Command(BaseCommand):
+    help = "Sets Category.top_product to each category's best seller from the daily sales aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Sales window in days')
+
+    def handle(self, *args, **options):
+        updated = sales.update_top_products(options['days'])
+        self.stdout.write(f"Updated top_product of {updated} categories.")
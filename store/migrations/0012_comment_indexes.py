@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_daily_sales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'status', 'datetime_created'], name='comment_product_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['status', 'datetime_created'], name='comment_status_idx'),
+        ),
+    ]
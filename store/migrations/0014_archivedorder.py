@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('datetime_created', models.DateTimeField()),
+                ('status', models.CharField(choices=[('p', 'Paid'), ('u', 'Unpaid'), ('c', 'Canceled')], max_length=1)),
+                ('items', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_orders', to='store.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'datetime_created'], name='archivedorder_customer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:43
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_updated_at(apps, schema_editor):
+    # Existing carts count as last touched when they were created.
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_archivedorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,44 @@
-from django.db import models
+from collections import Counter
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 from uuid import uuid4
 
+from .db import upsert_increment
+from .signals import comments_bulk_changed, products_bulk_changed
+
+
+class CategoryQuerySet(models.QuerySet):
+    def adjust_products_count(self, deltas):
+        """Apply {category_id: delta} to products_count in a single UPDATE."""
+        deltas = {category_id: delta for category_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        return self.filter(pk__in=deltas).update(products_count=F('products_count') + Case(
+            *[When(pk=category_id, then=Value(delta)) for category_id, delta in deltas.items()],
+            default=Value(0),
+        ))
+
+    def recount_products(self):
+        """Recompute products_count from the product table."""
+        counts = Product.objects.filter(category=OuterRef('pk')).order_by().values('category').annotate(
+            count=Count('pk')
+        ).values('count')
+        return self.update(products_count=Coalesce(Subquery(counts), 0))
+
 
 class Category(models.Model):
     title = models.CharField(max_length=255)
     description = models.CharField(max_length=500, blank=True)
     top_product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CategoryQuerySet.as_manager()
     
     def __str__(self):
         return self.title
@@ -17,6 +49,109 @@ class Discount(models.Model):
     description = models.CharField(max_length=255)
 
 
+_in_bulk_update = ContextVar('in_bulk_update', default=False)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Bulk operations skip model signals, so the ones that can move products
+    between categories keep Category.products_count in step here, bump
+    datetime_modified and announce the change through products_bulk_changed.
+    """
+    # update() announces the ids of at most this many products, else None.
+    max_announced_ids = 1000
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        category_ids = {obj.category_id for obj in objs}
+        if not kwargs.get('update_conflicts') and not kwargs.get('ignore_conflicts'):
+            Category.objects.adjust_products_count(Counter(obj.category_id for obj in objs))
+        else:
+            Category.objects.filter(pk__in=category_ids).recount_products()
+        product_ids = [obj.pk for obj in objs]
+        products_bulk_changed.send(
+            sender=self.model,
+            product_ids=None if None in product_ids else product_ids,
+            category_ids=category_ids,
+            fields=None,
+        )
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        category_ids = set()
+        if 'category' in fields or 'category_id' in fields:
+            category_ids = set(self.filter(pk__in=[obj.pk for obj in objs]).values_list('category_id', flat=True))
+            category_ids.update(obj.category_id for obj in objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.datetime_modified = now
+        # QuerySet.bulk_update() calls update() per batch; skip the bookkeeping there.
+        token = _in_bulk_update.set(True)
+        try:
+            rows = super().bulk_update(objs, [*fields, 'datetime_modified'], *args, **kwargs)
+        finally:
+            _in_bulk_update.reset(token)
+        if category_ids:
+            Category.objects.filter(pk__in=category_ids).recount_products()
+            for obj in objs:
+                obj._loaded_category_id = obj.category_id
+        products_bulk_changed.send(
+            sender=self.model, product_ids=[obj.pk for obj in objs], category_ids=category_ids, fields=fields,
+        )
+        return rows
+
+    def update(self, **kwargs):
+        if _in_bulk_update.get():
+            return super().update(**kwargs)
+        category_ids = set()
+        if 'category' in kwargs or 'category_id' in kwargs:
+            category_ids = set(self.order_by().values_list('category_id', flat=True).distinct())
+        # Past the limit, listing every id costs more than invalidating all products.
+        product_ids = list(self.order_by().values_list('pk', flat=True)[:self.max_announced_ids + 1])
+        if len(product_ids) > self.max_announced_ids:
+            product_ids = None
+        kwargs.setdefault('datetime_modified', timezone.now())
+        rows = super().update(**kwargs)
+        if category_ids:
+            new_category = kwargs.get('category_id', kwargs.get('category'))
+            category_ids.add(getattr(new_category, 'pk', new_category))
+            Category.objects.filter(pk__in=category_ids).recount_products()
+        products_bulk_changed.send(
+            sender=self.model, product_ids=product_ids, category_ids=category_ids, fields=list(kwargs),
+            modified_at=kwargs['datetime_modified'],
+        )
+        return rows
+
+    def reserve_inventory(self, quantities):
+        """
+        Take {product_id: quantity} out of stock with one conditional UPDATE.
+
+        Rows are matched through the primary key in ascending order, so
+        concurrent checkouts always lock products in the same order and
+        cannot deadlock each other. Returns False when any product is
+        short; the caller must then roll back its transaction, because
+        the products that did have enough stock were already decremented.
+        """
+        if not quantities:
+            return True
+        product_ids = sorted(quantities)
+        requested = Case(
+            *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in product_ids],
+            output_field=IntegerField(),
+        )
+        queryset = self.filter(pk__in=product_ids, inventory__gte=requested)
+        rows = super(ProductQuerySet, queryset).update(
+            inventory=F('inventory') - requested, datetime_modified=timezone.now(),
+        )
+        if rows != len(product_ids):
+            return False
+        products_bulk_changed.send(
+            sender=self.model, product_ids=product_ids, category_ids=set(), fields=['inventory'],
+        )
+        return True
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='products')
@@ -27,10 +162,41 @@ class Product(models.Model):
     datetime_created = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True)
     discounts = models.ManyToManyField(Discount, blank=True)
+
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         ordering = ('id', )
         
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Remembered so the save signals can tell a category change apart.
+        if 'category_id' in product.__dict__:
+            product._loaded_category_id = product.category_id
+        return product
+
+    def save(self, *args, **kwargs):
+        self._category_move = self.get_category_move(kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+        if self._category_move is not None:
+            self._loaded_category_id = self.category_id
+
+    def get_category_move(self, update_fields=None):
+        """(previous category id or None for a new product, new category id) if this save moves it, else None."""
+        if 'category_id' not in self.__dict__:
+            # Deferred and never assigned, so the save doesn't write it.
+            return None
+        if update_fields is not None and not {'category', 'category_id'} & set(update_fields):
+            return None
+        if self._state.adding:
+            return None, self.category_id
+        try:
+            previous = self._loaded_category_id
+        except AttributeError:
+            # Deferred when the product was loaded: ask the row.
+            previous = Product.objects.filter(pk=self.pk).values_list('category_id', flat=True).first()
+        return None if previous == self.category_id else (previous, self.category_id)
         
     def __str__(self) -> str:
         return self.name
@@ -69,6 +235,18 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='orders')
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID)
+    # The status the sales aggregates currently reflect (None: not counted yet).
+    sales_status = models.CharField(max_length=1, choices=ORDER_STATUS, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # A customer's history, read backwards for newest first.
+            models.Index(fields=['customer', 'datetime_created'], name='order_customer_history_idx'),
+            # Staff listings filtered by status.
+            models.Index(fields=['status', 'datetime_created'], name='order_status_idx'),
+            # Unfiltered staff listing, newest first.
+            models.Index(fields=['datetime_created'], name='order_created_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -81,6 +259,38 @@ class OrderItem(models.Model):
         unique_together = [['order', 'product']]
 
 
+class ArchivedOrder(models.Model):
+    """
+    A closed order moved out of Order/OrderItem by store.archive. `items`
+    holds its order items as zlib-compressed JSON.
+    """
+    # The pk the order had in the Order table.
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='archived_orders')
+    datetime_created = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=Order.ORDER_STATUS)
+    items = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['customer', 'datetime_created'], name='archivedorder_customer_idx')]
+
+
+class CommentQuerySet(models.QuerySet):
+    def set_status(self, status):
+        """Moderate every comment in the queryset with a single UPDATE."""
+        rows = list(self.values_list('pk', 'product_id'))
+        if not rows:
+            return 0
+        updated = self.model.objects.filter(pk__in=[pk for pk, product_id in rows]).update(status=status)
+        comments_bulk_changed.send(
+            sender=self.model,
+            comment_ids=[pk for pk, product_id in rows],
+            product_ids=sorted({product_id for pk, product_id in rows}),
+        )
+        return updated
+
+
 class Comment(models.Model):
     COMMENT_STATUS_WAITING = 'w'
     COMMENT_STATUS_APPROVED = 'a'
@@ -97,10 +307,67 @@ class Comment(models.Model):
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=2, choices=COMMENT_STATUS, default=COMMENT_STATUS_WAITING)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The approved feed of a product, read backwards for newest first
+            # (the primary key the index ends with breaks ties the same way).
+            models.Index(fields=['product', 'status', 'datetime_created'], name='comment_product_feed_idx'),
+            # The moderation queue, oldest first.
+            models.Index(fields=['status', 'datetime_created'], name='comment_status_idx'),
+        ]
+
+
+class CartQuerySet(models.QuerySet):
+    # Carts touched more recently than this aren't written to again.
+    touch_interval = timedelta(minutes=1)
+
+    def touch(self, cart_id):
+        """Record activity on a cart; a no-op UPDATE unless the last one is a while ago."""
+        now = timezone.now()
+        return self.filter(pk=cart_id, updated_at__lt=now - self.touch_interval).update(updated_at=now)
+
+    def delete_expired(self, cutoff, limit, after=None):
+        """
+        Delete up to `limit` carts (and their items) untouched since `cutoff`,
+        taking the next primary keys after `after`. Carts locked or touched
+        meanwhile are left alone. Returns (last primary key seen or None,
+        carts deleted, items deleted).
+        """
+        candidates = self.filter(updated_at__lt=cutoff).order_by('pk')
+        if after is not None:
+            candidates = candidates.filter(pk__gt=after)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return None, 0, 0
+        with transaction.atomic(using=self.db):
+            locked = self.filter(pk__in=ids, updated_at__lt=cutoff)
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                locked = locked.select_for_update(skip_locked=True)
+            expired = list(locked.values_list('pk', flat=True))
+            items = CartItem.objects.using(self.db).filter(cart_id__in=expired).delete()[0] if expired else 0
+            carts = self.filter(pk__in=expired).delete()[0] if expired else 0
+        return ids[-1], carts, items
+
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to the cart's items, see CartQuerySet.touch().
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = CartQuerySet.as_manager()
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add_items(self, cart_id, quantities):
+        """Add {product_id: quantity} to a cart in one upsert statement."""
+        rows = [
+            {'cart': cart_id, 'product': product_id, 'quantity': quantity}
+            for product_id, quantity in quantities.items()
+        ]
+        upsert_increment(self.model, rows, unique_fields=['cart', 'product'], increment_fields=['quantity'], using=self.db)
 
 
 class CartItem(models.Model):
@@ -108,5 +375,93 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_items')
     quantity = models.PositiveSmallIntegerField()
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product']]
+
+
+class OutboxEventQuerySet(models.QuerySet):
+    def publish(self, topic, payload):
+        """Record an event; call inside the transaction that made the change."""
+        return self.create(topic=topic, payload=payload)
+
+    def available(self):
+        now = timezone.now()
+        return self.filter(status=OutboxEvent.STATUS_PENDING, available_at__lte=now).filter(
+            models.Q(locked_until__isnull=True) | models.Q(locked_until__lt=now)
+        )
+
+    def claim(self, worker, limit, lease_seconds):
+        """
+        Lease up to `limit` due events to `worker`. Uses SELECT ... FOR UPDATE
+        SKIP LOCKED where the database supports it so concurrent workers pass
+        over each other's rows; elsewhere the conditional UPDATE of the lease
+        decides which worker gets a row.
+        """
+        connection = connections[self.db]
+        locked_until = timezone.now() + timedelta(seconds=lease_seconds)
+        with transaction.atomic(using=self.db):
+            candidates = self.available().order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('id', flat=True)[:limit])
+            if not ids:
+                return []
+            self.available().filter(pk__in=ids).update(locked_by=worker, locked_until=locked_until)
+        return list(self.filter(pk__in=ids, locked_by=worker, locked_until=locked_until).order_by('id'))
+
+
+class OutboxEvent(models.Model):
+    STATUS_PENDING = 'p'
+    STATUS_DONE = 'd'
+    STATUS_FAILED = 'f'
+    STATUS = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    TOPIC_ORDER_CREATED = 'order.created'
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=1, choices=STATUS, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'])]
+
+
+class ProductDailySales(models.Model):
+    """Units and revenue of a product's non-canceled orders, per order day."""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_units = models.IntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['date', 'product']]
+        indexes = [models.Index(fields=['category', 'date'])]
+
+
+class CategoryDailySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_units = models.IntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['date', 'category']]
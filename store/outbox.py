@@ -0,0 +1,122 @@
+"""
+Delivery of OutboxEvent rows to the signals their topics map to.
+
+Events are written in the same transaction as the change they describe and
+delivered afterwards by the `process_outbox` worker, at least once: an
+event whose receivers fail is retried with exponential backoff, so
+receivers must tolerate seeing the same event twice.
+"""
+import random
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from core.metrics import registry
+
+from .models import Order, OutboxEvent
+from .signals import order_create
+
+
+def load_order_created(payload):
+    return {'order': Order.objects.get(pk=payload['order_id'])}
+
+
+# topic -> (signal, function turning the payload into the signal's kwargs)
+TOPICS = {
+    OutboxEvent.TOPIC_ORDER_CREATED: (order_create, load_order_created),
+}
+
+
+def deliver(event):
+    """Send one event to its receivers; raises the first receiver error."""
+    try:
+        signal, load = TOPICS[event.topic]
+        for receiver, response in signal.send_robust(sender=OutboxEvent, **load(event.payload)):
+            if isinstance(response, Exception):
+                raise response
+    finally:
+        # Worker threads keep their own connection; drop it if it went bad.
+        connection.close_if_unusable_or_obsolete()
+
+
+def get_retry_delay(attempts, base=2, cap=3600):
+    """Exponential backoff with jitter, in seconds."""
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def mark_done(events):
+    OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+        status=OutboxEvent.STATUS_DONE, processed_at=timezone.now(), locked_by='', locked_until=None,
+    )
+
+
+def mark_failed(event, error, max_attempts):
+    event.attempts += 1
+    now = timezone.now()
+    event.last_error = f'{type(error).__name__}: {error}'
+    event.locked_by, event.locked_until = '', None
+    if event.attempts >= max_attempts:
+        event.status = OutboxEvent.STATUS_FAILED
+        event.processed_at = now
+    else:
+        event.available_at = now + timedelta(seconds=get_retry_delay(event.attempts))
+    event.save(update_fields=['attempts', 'last_error', 'locked_by', 'locked_until', 'status',
+                              'processed_at', 'available_at'])
+
+
+def process_batch(worker, executor, batch_size=100, lease_seconds=60, max_attempts=10):
+    """Claim a batch, deliver it concurrently on `executor`. Returns (done, failed) counts."""
+    events = OutboxEvent.objects.claim(worker, batch_size, lease_seconds)
+    done, failed = [], 0
+    futures = [(event, executor.submit(deliver, event)) for event in events]
+    for event, future in futures:
+        error = future.exception()
+        if error is None:
+            done.append(event)
+        else:
+            failed += 1
+            mark_failed(event, error, max_attempts)
+    mark_done(done)
+    return len(done), failed
+
+
+def purge(days):
+    """Delete events delivered more than `days` days ago."""
+    cutoff = timezone.now() - timedelta(days=days)
+    return OutboxEvent.objects.filter(status=OutboxEvent.STATUS_DONE, processed_at__lt=cutoff).delete()[0]
+
+
+def get_stats():
+    now = timezone.now()
+    stats = OutboxEvent.objects.aggregate(
+        pending=Count('pk', filter=Q(status=OutboxEvent.STATUS_PENDING)),
+        failed=Count('pk', filter=Q(status=OutboxEvent.STATUS_FAILED)),
+        processed_last_minute=Count('pk', filter=Q(status=OutboxEvent.STATUS_DONE,
+                                                   processed_at__gte=now - timedelta(minutes=1))),
+        oldest_pending=Min('created_at', filter=Q(status=OutboxEvent.STATUS_PENDING)),
+    )
+    oldest = stats.pop('oldest_pending')
+    stats['lag_seconds'] = (now - oldest).total_seconds() if oldest else 0.0
+    return stats
+
+
+def collect_metrics():
+    stats = get_stats()
+    return [
+        '# HELP store_outbox_lag_seconds Age of the oldest undelivered outbox event.',
+        '# TYPE store_outbox_lag_seconds gauge',
+        f"store_outbox_lag_seconds {stats['lag_seconds']}",
+        '# HELP store_outbox_events Outbox events by status.',
+        '# TYPE store_outbox_events gauge',
+        f"store_outbox_events{{status=\"pending\"}} {stats['pending']}",
+        f"store_outbox_events{{status=\"failed\"}} {stats['failed']}",
+        '# HELP store_outbox_processed_last_minute Events delivered in the last minute.',
+        '# TYPE store_outbox_processed_last_minute gauge',
+        f"store_outbox_processed_last_minute {stats['processed_last_minute']}",
+    ]
+
+
+registry.register_collector(collect_metrics)
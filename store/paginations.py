@@ -1,5 +1,295 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections, DatabaseError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class DefaultProductPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, using acount() and async iteration."""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [row async for row in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+
+def estimate_count(queryset):
+    """
+    Row count taken from the database's table statistics instead of COUNT(*).
+    Returns None when the queryset is filtered or no statistics are available.
+    """
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = ('SELECT TABLE_ROWS FROM information_schema.TABLES '
+               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s')
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'sqlite':
+        # sqlite_stat1 only exists once ANALYZE has been run.
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite' and not cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone():
+                # Without statistics, the highest rowid is a close upper bound.
+                sql = 'SELECT MAX(rowid) FROM %s' % connection.ops.quote_name(table)
+                cursor.execute(sql)
+            else:
+                cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django paginator (for admin changelists) that takes the row count of
+    an unfiltered queryset from the table statistics once the table is
+    bigger than `exact_count_threshold`, instead of running COUNT(*).
+    """
+    exact_count_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.exact_count_threshold:
+            return estimate
+        return super().count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over whatever ordering the queryset already has.
+
+    The primary key is appended as a tie-breaker so the ordering is total,
+    and pages are fetched with a `WHERE (a, pk) > (x, y)` style condition
+    instead of OFFSET. Cursors are opaque base64 tokens. The total count is
+    only computed on request: `?count=exact` or `?count=estimate`.
+    """
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('pk', )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request)
+        queryset, reverse = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset), reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.count = await self.aget_count(queryset, request)
+        queryset, reverse = self.get_page_queryset(queryset, request)
+        return self.set_page([row async for row in queryset], reverse)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.ordering = self.get_ordering(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+
+        ordering = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_condition(ordering, position))
+        return queryset[:self.page_size + 1], reverse
+
+    def set_page(self, rows, reverse):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    async def aget_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return await queryset.acount()
+        if mode == 'estimate':
+            return await sync_to_async(estimate_count)(queryset)
+        return None
+
+    def get_ordering(self, queryset):
+        opts = queryset.model._meta
+        ordering = list(queryset.query.order_by or opts.ordering or self.ordering)
+        ordering = [field for field in ordering if isinstance(field, str)]
+        pk_names = {'pk', opts.pk.name}
+        if not any(field.lstrip('-') in pk_names for field in ordering):
+            ordering.append('pk')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def seek_condition(ordering, position):
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = [Q(**{previous.lstrip('-'): value}) for previous, value in zip(ordering[:index], position)]
+            conditions.append(reduce(and_, equal + [Q(**{f'{name}__{lookup}': position[index]})]))
+        return reduce(or_, conditions)
+
+    def get_position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                value = row[name]
+            else:
+                value = row
+                for attr in ('pk' if name == 'pk' else name).split('__'):
+                    value = getattr(value, attr)
+            position.append(value)
+        return position
+
+    def encode_cursor(self, row, reverse):
+        token = self.get_cursor_token(row, reverse)
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_cursor_token(self, row, reverse=False):
+        payload = {'p': [str(value) if not isinstance(value, (int, type(None))) else value
+                         for value in self.get_position(row)]}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            position = payload['p']
+            if len(position) != len(self.ordering):
+                raise ValueError
+            position = [self.to_python(field, value) for field, value in zip(self.ordering, position)]
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+    def to_python(self, field, value):
+        name = field.lstrip('-')
+        if value is None or '__' in name:
+            return value
+        try:
+            if name == 'pk':
+                model_field = self.model._meta.pk
+            elif name in self.annotations:
+                # e.g. the search_rank ProductSearchFilter orders by.
+                model_field = self.annotations[name].output_field
+            else:
+                model_field = self.model._meta.get_field(name)
+            return model_field.to_python(value)
+        except Exception:
+            raise ValueError(value)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class ProductKeysetPagination(KeysetPagination):
+    page_size = 10
+
+
+class CommentKeysetPagination(KeysetPagination):
+    page_size = 20
+
+
+class OrderKeysetPagination(KeysetPagination):
+    page_size = 20
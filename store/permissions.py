@@ -10,6 +10,19 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         return bool((request.user and request.user.is_staff) or request.method == 'GET') 
     
 
+class IsCustomer(permissions.IsAuthenticated):
+    """Authenticated users with a customer profile; e.g. staff accounts may have none."""
+    message = 'This account has no customer profile.'
+
+    def has_permission(self, request, view):
+        return super().has_permission(request, view) and hasattr(request.user, 'customer')
+
+
+class IsCustomerOrAdmin(IsCustomer):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_staff) or super().has_permission(request, view)
+
+
 class SendPrivateEmailToCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.has_perm('store.send_private_email'))   
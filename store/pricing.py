@@ -0,0 +1,77 @@
+"""
+Batch pricing of products: list price, discount and tax.
+
+A product's price is its `unit_price` less the largest of its discounts
+(discounts don't stack), then plus STORE_TAX_RATE. Amounts are exact
+decimals rounded half up to the cent. Discounts for a whole batch are
+read with one query.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Product
+
+
+CENT = Decimal('0.01')
+ZERO = Decimal(0)
+ONE = Decimal(1)
+
+
+@dataclass(frozen=True)
+class Price:
+    list_price: Decimal
+    discount: Decimal
+    discounted: Decimal
+    after_tax: Decimal
+
+
+def get_tax_rate():
+    return Decimal(str(getattr(settings, 'STORE_TAX_RATE', '0.09')))
+
+
+def get_discounts(product_ids):
+    """{product_id: best discount as a fraction} for the products that have one."""
+    rows = (
+        Product.discounts.through.objects.filter(product_id__in=product_ids)
+        .values('product_id').annotate(best=Max('discount__discount')).order_by()
+        .values_list('product_id', 'best')
+    )
+    # str() keeps the float's shortest repr, e.g. 0.15 -> Decimal('0.15').
+    return {product_id: min(max(Decimal(str(best)), ZERO), ONE) for product_id, best in rows}
+
+
+def get_prices(products, tax_rate=None):
+    """{pk: Price} for objects with `pk` and `unit_price`."""
+    products = list(products)
+    if not products:
+        return {}
+    discounts = get_discounts({product.pk for product in products})
+    tax_multiplier = ONE + (get_tax_rate() if tax_rate is None else tax_rate)
+    prices = {}
+    for product in products:
+        list_price = product.unit_price
+        if not isinstance(list_price, Decimal):
+            list_price = Decimal(str(list_price))
+        discount = discounts.get(product.pk, ZERO)
+        discounted = (list_price * (ONE - discount)).quantize(CENT, ROUND_HALF_UP) if discount else list_price
+        after_tax = (discounted * tax_multiplier).quantize(CENT, ROUND_HALF_UP)
+        prices[product.pk] = Price(list_price, discount, discounted, after_tax)
+    return prices
+
+
+def attach_prices(products, tax_rate=None):
+    """Set `._price` on every product that doesn't have one yet."""
+    pending = [product for product in products if getattr(product, '_price', None) is None]
+    prices = get_prices(pending, tax_rate)
+    for product in pending:
+        product._price = prices[product.pk]
+    return products
+
+
+def get_price(product):
+    if getattr(product, '_price', None) is None:
+        attach_prices([product])
+    return product._price
@@ -0,0 +1,216 @@
+"""
+Daily sales aggregates kept up to date as orders come in and change status.
+
+An order counts towards `units`/`revenue` unless it is canceled and towards
+`paid_units`/`paid_revenue` once it is paid. `Order.sales_status` is the
+status the aggregates currently reflect, so `record_order()` only adds the
+difference to the order's current status and can safely run more than once.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import unpack_items
+from .db import upsert_increment
+from .models import ArchivedOrder, Category, CategoryDailySales, Order, OrderItem, Product, ProductDailySales
+
+
+SALES_FIELDS = ['units', 'revenue', 'paid_units', 'paid_revenue']
+
+
+def get_weights(status):
+    """(counted, paid) multipliers for an order in `status`."""
+    if status is None or status == Order.ORDER_STATUS_CANCELED:
+        return 0, 0
+    return 1, int(status == Order.ORDER_STATUS_PAID)
+
+
+def record_order(order_id):
+    """Bring the aggregates in line with the order's current status."""
+    with transaction.atomic():
+        order = Order.objects.select_for_update().only('status', 'sales_status', 'datetime_created').get(pk=order_id)
+        if order.status == order.sales_status:
+            return False
+        counted, paid = [new - old for new, old in zip(get_weights(order.status), get_weights(order.sales_status))]
+        if counted or paid:
+            date = order.datetime_created.date()
+            items = list(OrderItem.objects.filter(order_id=order_id).values_list(
+                'product_id', 'product__category_id', 'quantity', 'unit_price'
+            ))
+            # Keep adjusting the category the sale was first booked under, even
+            # if the product has moved since.
+            booked = dict(ProductDailySales.objects.filter(
+                date=date, product_id__in=[item[0] for item in items]
+            ).values_list('product_id', 'category_id'))
+
+            product_rows = []
+            category_rows = defaultdict(lambda: dict.fromkeys(SALES_FIELDS, 0))
+            for product_id, category_id, quantity, unit_price in items:
+                category_id = booked.get(product_id, category_id)
+                revenue = quantity * unit_price
+                row = {
+                    'units': counted * quantity,
+                    'revenue': counted * revenue,
+                    'paid_units': paid * quantity,
+                    'paid_revenue': paid * revenue,
+                }
+                product_rows.append({'date': date, 'product': product_id, 'category': category_id, **row})
+                for field, value in row.items():
+                    category_rows[category_id][field] += value
+
+            upsert_increment(ProductDailySales, product_rows, unique_fields=['date', 'product'],
+                             increment_fields=SALES_FIELDS)
+            upsert_increment(
+                CategoryDailySales,
+                [{'date': date, 'category': category_id, **row} for category_id, row in category_rows.items()],
+                unique_fields=['date', 'category'], increment_fields=SALES_FIELDS,
+            )
+        Order.objects.filter(pk=order_id).update(sales_status=order.status)
+        return True
+
+
+def rebuild(batch_size=2000, days=7):
+    """
+    Recompute every aggregate from the order tables, archived orders
+    included, `days` days of orders at a time. Each stretch of days is
+    rebuilt in its own transaction, so orders and aggregates are never
+    locked for the whole history at once.
+    """
+    dates = []
+    for queryset, field in [(Order.objects, 'datetime_created'), (ArchivedOrder.objects, 'datetime_created'),
+                            (ProductDailySales.objects, 'date'), (CategoryDailySales.objects, 'date')]:
+        bounds = queryset.aggregate(first=Min(field), last=Max(field)).values()
+        dates += [value.date() if isinstance(value, datetime) else value for value in bounds if value is not None]
+    if dates:
+        start, last = min(dates), max(dates)
+        while start <= last:
+            rebuild_dates(start, start + timedelta(days=days), batch_size)
+            start += timedelta(days=days)
+    return ProductDailySales.objects.count()
+
+
+def rebuild_dates(start, end, batch_size=2000):
+    """Recompute the aggregates of the dates from `start` up to, not including, `end`."""
+    created = {
+        'datetime_created__gte': datetime.combine(start, datetime.min.time()),
+        'datetime_created__lt': datetime.combine(end, datetime.min.time()),
+    }
+    paid = Q(order__status=Order.ORDER_STATUS_PAID)
+    revenue = F('quantity') * F('unit_price')
+    with transaction.atomic():
+        ProductDailySales.objects.filter(date__gte=start, date__lt=end).delete()
+        CategoryDailySales.objects.filter(date__gte=start, date__lt=end).delete()
+        Order.objects.filter(**created).update(sales_status=F('status'))
+
+        rows = (
+            OrderItem.objects.filter(**{f'order__{lookup}': value for lookup, value in created.items()})
+            .exclude(order__status=Order.ORDER_STATUS_CANCELED)
+            .annotate(date=TruncDate('order__datetime_created'))
+            .values('date', 'product_id', 'product__category_id')
+            .annotate(
+                units=Sum('quantity'),
+                revenue=Sum(revenue),
+                paid_units=Sum('quantity', filter=paid, default=0),
+                paid_revenue=Sum(revenue, filter=paid, default=0),
+            )
+            .order_by()
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            row['category_id'] = row.pop('product__category_id')
+            batch.append(ProductDailySales(**row))
+            if len(batch) >= batch_size:
+                ProductDailySales.objects.bulk_create(batch)
+                batch = []
+        ProductDailySales.objects.bulk_create(batch)
+        add_archived_orders(batch_size, ArchivedOrder.objects.filter(**created))
+
+        CategoryDailySales.objects.bulk_create([
+            CategoryDailySales(**row)
+            for row in ProductDailySales.objects.filter(date__gte=start, date__lt=end).values(
+                'date', 'category_id',
+            ).annotate(**{field: Sum(field) for field in SALES_FIELDS}).order_by()
+        ], batch_size=batch_size)
+
+
+def add_archived_orders(batch_size=2000, queryset=None):
+    """Add the items of archived orders (see store.archive) to ProductDailySales."""
+    queryset = ArchivedOrder.objects.all() if queryset is None else queryset
+    orders = queryset.exclude(status=Order.ORDER_STATUS_CANCELED).values_list(
+        'datetime_created', 'status', 'items',
+    ).order_by('pk').iterator(chunk_size=batch_size)
+    chunk = []
+    for order in orders:
+        chunk.append(order)
+        if len(chunk) >= batch_size:
+            add_archived_chunk(chunk)
+            chunk = []
+    add_archived_chunk(chunk)
+
+
+def add_archived_chunk(orders):
+    orders = [(created.date(), status, unpack_items(items)) for created, status, items in orders]
+    categories = dict(Product.objects.filter(
+        pk__in={item['product_id'] for _, _, items in orders for item in items}
+    ).values_list('pk', 'category_id'))
+    rows = {}
+    for date, status, items in orders:
+        counted, paid = get_weights(status)
+        for item in items:
+            # Products deleted since have no aggregates to add to.
+            if item['product_id'] not in categories:
+                continue
+            quantity, revenue = item['quantity'], item['quantity'] * Decimal(item['unit_price'])
+            row = rows.setdefault((date, item['product_id']), {
+                'date': date, 'product': item['product_id'], 'category': categories[item['product_id']],
+                **dict.fromkeys(SALES_FIELDS, 0),
+            })
+            row['units'] += counted * quantity
+            row['revenue'] += counted * revenue
+            row['paid_units'] += paid * quantity
+            row['paid_revenue'] += paid * revenue
+    upsert_increment(ProductDailySales, list(rows.values()), unique_fields=['date', 'product'],
+                     increment_fields=SALES_FIELDS)
+
+
+def top_products(start, end, limit=10, category_id=None):
+    """Best sellers by units between `start` and `end` (inclusive)."""
+    queryset = ProductDailySales.objects.filter(date__gte=start, date__lte=end)
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    return list(
+        queryset.values('product', name=F('product__name'))
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0)
+        .order_by('-units', '-revenue', 'product')[:limit]
+    )
+
+
+def update_top_products(days=30):
+    """
+    Point every category with sales in the last `days` days at its best
+    seller, and every other category at no product.
+    """
+    since = timezone.now().date() - timedelta(days=days)
+    rows = (
+        ProductDailySales.objects.filter(date__gte=since)
+        .values('category', 'product')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0)
+        .order_by('category', '-units', '-revenue', 'product')
+    )
+    top = {}
+    for row in rows.iterator():
+        top.setdefault(row['category'], row['product'])
+    with transaction.atomic():
+        Category.objects.exclude(pk__in=top).exclude(top_product=None).update(top_product=None)
+        if not top:
+            return 0
+        return Category.objects.filter(pk__in=top).update(top_product=Case(
+            *[When(pk=category_id, then=Value(product_id)) for category_id, product_id in top.items()]
+        ))
@@ -0,0 +1,236 @@
+import math
+import os
+import pickle
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class ProductSearchIndex:
+    """
+    Inverted index over product name, description and category title,
+    ranked with BM25. The last query term is matched as a prefix so the
+    index can serve search-as-you-type.
+    """
+    k1 = 1.2
+    b = 0.75
+    field_weights = {'name': 3, 'category': 2, 'description': 1}
+    max_prefix_terms = 50
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.max_id = 0
+        self.built_at = None
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['_vocabulary'] = None
+        state['postings'] = dict(self.postings)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.postings = defaultdict(dict, self.postings)
+        self.lock = threading.RLock()
+
+    def document_terms(self, name, description, category):
+        terms = Counter()
+        for field, text in (('name', name), ('description', description), ('category', category)):
+            weight = self.field_weights[field]
+            for token in tokenize(text):
+                terms[token] += weight
+        return terms
+
+    def add(self, product_id, name, description, category):
+        terms = self.document_terms(name, description, category)
+        with self.lock:
+            self._remove(product_id)
+            for term, frequency in terms.items():
+                if term not in self.postings:
+                    self._vocabulary = None
+                self.postings[term][product_id] = frequency
+            length = sum(terms.values())
+            self.doc_terms[product_id] = tuple(terms)
+            self.doc_lengths[product_id] = length
+            self.total_length += length
+            self.max_id = max(self.max_id, product_id)
+
+    def remove(self, product_id):
+        with self.lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        for term in self.doc_terms.pop(product_id, ()):
+            documents = self.postings.get(term)
+            if documents is None:
+                continue
+            documents.pop(product_id, None)
+            if not documents:
+                del self.postings[term]
+                self._vocabulary = None
+        self.total_length -= self.doc_lengths.pop(product_id, 0)
+
+    def expand(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:start + self.max_prefix_terms]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit=None):
+        """Return [(product_id, score), ...] best match first."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            document_count = len(self.doc_lengths)
+            if not document_count:
+                return []
+            average_length = self.total_length / document_count
+            scores = defaultdict(float)
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    terms = self.expand(token) or [token]
+                else:
+                    terms = [token]
+                for term in terms:
+                    documents = self.postings.get(term)
+                    if not documents:
+                        continue
+                    idf = math.log(1 + (document_count - len(documents) + 0.5) / (len(documents) + 0.5))
+                    for product_id, frequency in documents.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[product_id] / average_length)
+                        scores[product_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def index_queryset(self, queryset, chunk_size=2000):
+        rows = queryset.order_by().values_list('id', 'name', 'description', 'category__title')
+        for product_id, name, description, category in rows.iterator(chunk_size=chunk_size):
+            self.add(product_id, name, description, category)
+
+    def refresh(self, since=None, prune=True):
+        """
+        Bring the index up to date with products changed since a point in
+        time. `prune` also drops deleted products, which reads every id.
+        """
+        from store.models import Product
+
+        started_at = timezone.now()
+        changed = Product.objects.filter(pk__gt=self.max_id)
+        if since is not None:
+            changed = changed | Product.objects.filter(datetime_modified__gte=since)
+        self.index_queryset(changed)
+        if prune:
+            existing = set(Product.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+            for product_id in set(self.doc_lengths) - existing:
+                self.remove(product_id)
+        self.built_at = started_at
+
+    def is_stale(self):
+        seconds = getattr(settings, 'PRODUCT_SEARCH_REFRESH_SECONDS', 60)
+        return self.built_at is None or (timezone.now() - self.built_at).total_seconds() > seconds
+
+    @classmethod
+    def build(cls):
+        from store.models import Product
+
+        index = cls()
+        index.built_at = timezone.now()
+        index.index_queryset(Product.objects.all())
+        return index
+
+    def save(self, path):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as file:
+            with self.lock:
+                pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+_index = None
+_index_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def get_index_path():
+    return getattr(settings, 'PRODUCT_SEARCH_INDEX_PATH', settings.BASE_DIR / 'product_search_index.pickle')
+
+
+def load_product_index():
+    """
+    Load the process-wide index from the snapshot written by
+    `rebuild_search_index` (caught up with later changes), or build it from
+    the database when there is no snapshot. Runs at process startup (see
+    config.wsgi and config.asgi), so no request pays for it.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = get_index_path()
+            if os.path.exists(path):
+                index = ProductSearchIndex.load(path)
+                index.refresh(since=index.built_at)
+            else:
+                index = ProductSearchIndex.build()
+            _index = index
+    return _index
+
+
+def get_product_index():
+    """
+    The process-wide index, or None if this process hasn't loaded it.
+
+    Signals update it with this process's changes right away. Changes made
+    by other processes are caught up with every PRODUCT_SEARCH_REFRESH_SECONDS,
+    through the products' datetime_modified; products they deleted stay in
+    the index (searches filter them out) until the next load.
+    """
+    index = _index
+    if index is not None and index.is_stale() and _refresh_lock.acquire(blocking=False):
+        # Other threads keep searching the current index meanwhile.
+        try:
+            index.refresh(since=index.built_at, prune=False)
+        finally:
+            _refresh_lock.release()
+    return index
+
+
+def get_loaded_product_index():
+    """The index if this process has loaded it, else None."""
+    return _index
+
+
+def reset_product_index():
+    global _index
+    _index = None
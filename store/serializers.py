@@ -1,17 +1,20 @@
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db import transaction
+from django.db import models, transaction
 
 from rest_framework import serializers
 
-from decimal import Decimal
+from datetime import timedelta
 
-from .models import Cart, CartItem, Category, Customer, Order, OrderItem, Product, Comment
+from . import pricing
+from .fieldsets import SparseFieldsetMixin
+from .models import Cart, CartItem, Category, Customer, Order, OrderItem, OutboxEvent, Product, Comment
 
 
 class CategorySerializer(serializers.ModelSerializer):
     
-    porducts_num = serializers.IntegerField(source='products.count', read_only=True)
+    porducts_num = serializers.IntegerField(source='products_count', read_only=True)
     
     class Meta:
         model = Category
@@ -39,20 +42,36 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class PricedListSerializer(serializers.ListSerializer):
+    """Lets the child price the whole page at once (see `prepare_batch()`)."""
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.prepare_batch(items)
+        return super().to_representation(items)
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # name = serializers.CharField(max_length=255)
     # unit_price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    discounted_price = serializers.SerializerMethodField()
     price_after_tax = serializers.SerializerMethodField(method_name='get_after_tax')
     # detail = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'unit_price','category', 'price_after_tax', 'inventory', 'description']
+        fields = ['id', 'name', 'unit_price', 'discounted_price', 'category', 'price_after_tax', 'inventory', 'description']
+        field_sources = {'discounted_price': ['unit_price'], 'price_after_tax': ['unit_price']}
+        list_serializer_class = PricedListSerializer
 
+    def prepare_batch(self, products):
+        if {'discounted_price', 'price_after_tax'} & set(self.fields):
+            pricing.attach_prices(products)
 
+    def get_discounted_price(self, product):
+        return pricing.get_price(product).discounted
 
     def get_after_tax(self, product):
-        return round(product.unit_price * Decimal(1.09), 2)
+        return pricing.get_price(product).after_tax
 
     def get_detail(self, product):
         request = self.context['request']
@@ -75,19 +94,26 @@ class ProductSerializer(serializers.ModelSerializer):
     #     return instance
     
    
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     
     # product = serializers.StringRelatedField()
 
     class Meta:
         model = Comment
         fields = ['id', 'name', 'body', 'status']
+        # Only moderators change the status, through CommentViewSet.moderation.
+        read_only_fields = ['status']
         
     def create(self, validated_data):
         product_id = self.context.get('product_pk')
-        return Comment.objects.create(product_id=product_id, **validated_data)
+        return Comment.objects.create(product_id=product_id, status=Comment.COMMENT_STATUS_WAITING, **validated_data)
     
 
+class CommentModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=[Comment.COMMENT_STATUS_APPROVED, Comment.COMMENT_STATUS_NOT_APPROVED])
+
+
 class CartProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -95,27 +121,82 @@ class CartProductSerializer(serializers.ModelSerializer):
 
 
 
+# CartItem.quantity is a PositiveSmallIntegerField.
+MAX_CART_QUANTITY = 32767
+
+
 class AddCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity']
+
+    def validate(self, attrs):
+        # Added to what the cart already holds.
+        in_cart = CartItem.objects.filter(
+            cart_id=self.context.get('cart_pk'), product=attrs['product'],
+        ).values_list('quantity', flat=True).first() or 0
+        if in_cart + attrs['quantity'] > MAX_CART_QUANTITY:
+            raise serializers.ValidationError(
+                {'quantity': f'A cart holds at most {MAX_CART_QUANTITY} of a product; it has {in_cart}.'}
+            )
+        return attrs
         
     def create(self, validated_data):
         cart_pk = self.context.get('cart_pk')
         product = validated_data.get('product')
         quantity = validated_data.get('quantity')
         
-        try:
-            cart_item = CartItem.objects.get(cart_id=cart_pk, product_id=product.id)
-            cart_item.quantity += quantity
-            cart_item.save()
-        except CartItem.DoesNotExist:
-            cart_item = CartItem.objects.create(cart_id=cart_pk, **validated_data)
+        CartItem.objects.add_items(cart_pk, {product.id: quantity})
+        cart_item = CartItem.objects.get(cart_id=cart_pk, product_id=product.id)
 
         self.instance = cart_item
         return cart_item
     
     
+class BatchCartItemEntrySerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_CART_QUANTITY)
+
+
+class BatchCartItemSerializer(serializers.Serializer):
+    items = BatchCartItemEntrySerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate(self, attrs):
+        cart_pk = self.context.get('cart_pk')
+        if not Cart.objects.filter(pk=cart_pk).exists():
+            raise serializers.ValidationError('This cart is not.')
+
+        quantities = {}
+        for item in attrs['items']:
+            quantities[item['product']] = quantities.get(item['product'], 0) + item['quantity']
+        in_cart = dict(
+            Product.objects.filter(pk__in=quantities).annotate(
+                in_cart=models.Sum('cart_items__quantity', filter=models.Q(cart_items__cart_id=cart_pk)),
+            ).values_list('id', 'in_cart')
+        )
+        missing = set(quantities) - set(in_cart)
+        if missing:
+            raise serializers.ValidationError({'items': f'Products {sorted(missing)} do not exist.'})
+        too_many = sorted(
+            product_id for product_id, quantity in quantities.items()
+            if quantity + (in_cart[product_id] or 0) > MAX_CART_QUANTITY
+        )
+        if too_many:
+            raise serializers.ValidationError(
+                {'items': f'A cart holds at most {MAX_CART_QUANTITY} of a product; products {too_many} would exceed it.'}
+            )
+        attrs['quantities'] = quantities
+        return attrs
+
+    def save(self, **kwargs):
+        cart_pk = self.context.get('cart_pk')
+        quantities = self.validated_data['quantities']
+        CartItem.objects.add_items(cart_pk, quantities)
+        return list(
+            CartItem.objects.filter(cart_id=cart_pk, product_id__in=quantities).select_related('product')
+        )
+
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
@@ -124,13 +205,22 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
     
 class CartItemSerailizer(serializers.ModelSerializer):
     product = CartProductSerializer()
+    # What checkout will charge per item, as OrderItem.unit_price.
+    unit_price = serializers.SerializerMethodField()
     total_price = serializers.SerializerMethodField()
     class Meta:
         model = CartItem
-        fields = ['id', 'product', 'quantity', 'total_price']
+        fields = ['id', 'product', 'quantity', 'unit_price', 'total_price']
+        list_serializer_class = PricedListSerializer
+
+    def prepare_batch(self, cart_items):
+        pricing.attach_prices([cart_item.product for cart_item in cart_items])
+
+    def get_unit_price(self, cart_item):
+        return pricing.get_price(cart_item.product).discounted
 
     def get_total_price(self, cart_item):
-        return cart_item.quantity * cart_item.product.unit_price
+        return cart_item.quantity * pricing.get_price(cart_item.product).discounted
     
     
 class CartSerailizer(serializers.ModelSerializer):
@@ -142,7 +232,9 @@ class CartSerailizer(serializers.ModelSerializer):
         read_only_fields = ['id',]
         
     def get_total_price(self, cart):
-        return sum([item.quantity * item.product.unit_price for item in cart.items.all()])
+        items = cart.items.all()
+        pricing.attach_prices([item.product for item in items])
+        return sum([item.quantity * pricing.get_price(item.product).discounted for item in items])
         
 
 class OrderCustomSerailizer(serializers.ModelSerializer):
@@ -177,7 +269,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 
         
-class OrderAdminSerializer(serializers.ModelSerializer):
+class OrderAdminSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     customer = OrderCustomSerailizer()
     class Meta:
@@ -185,58 +277,97 @@ class OrderAdminSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer', 'datetime_created', 'status', 'items']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     class Meta:
         model = Order
         fields = ['id', 'datetime_created', 'items']
 
 
+class OutOfStock(Exception):
+    def __init__(self, quantities):
+        super().__init__(quantities)
+        self.quantities = quantities
+
+
 class OrderCreateSerializer(serializers.Serializer):
+    # Whether the cart exists and has items is checked in create_order,
+    # under the cart's lock.
     cart_id=serializers.UUIDField()
-    
-    def validate_cart_id(self, cart_id):
-        try:
-            if Cart.objects.prefetch_related('items').get(id=cart_id).items.count() == 0:
-                raise serializers.ValidationError('This cart is empyu.')
-        except Cart.DoesNotExist:
-            raise serializers.ValidationError('This cart is not.')
-        
-        # if not Cart.objects.filter(id=cart_id).exists():
-        #     raise serializers.ValidationError('This not cart id.')
-        # if CartItem.objects.get(cart_id=cart_id).items.count() == 0:
-        #     raise serializers.ValidationError('this cart is Empty.')
-        
-        return cart_id
-    
-    
+
     def save(self, **kwargs):
+        try:
+            return self.create_order()
+        except OutOfStock as error:
+            raise serializers.ValidationError({'out_of_stock': self.get_shortages(error.quantities)})
+
+    def create_order(self):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
-            customer = Customer.objects.get(user_id=user_id)
+            # Locked until commit: a concurrent checkout of the same cart waits
+            # here and then finds it gone, and expire_carts skips it.
+            if not list(Cart.objects.select_for_update().filter(pk=cart_id).values_list('pk', flat=True)):
+                raise serializers.ValidationError({'cart_id': ['This cart is not.']})
+            cart_items = list(CartItem.objects.select_related('product').filter(cart_id=cart_id))
+            if not cart_items:
+                raise serializers.ValidationError({'cart_id': ['This cart is empyu.']})
+            quantities = {item.product_id: item.quantity for item in cart_items}
+            if not Product.objects.reserve_inventory(quantities):
+                raise OutOfStock(quantities)
+            prices = pricing.get_prices(item.product for item in cart_items)
 
             order = Order()
-            order.customer_id = customer.id
+            order.customer_id = self.context['customer_id']
             order.save()
             
-            cart_items = CartItem.objects.select_related('product').filter(cart_id=cart_id)
-            
             order_items = [OrderItem(
                 order_id=order.id,
                 product_id=item.product.id,
                 quantity = item.quantity,
-                unit_price = item.product.unit_price,
+                unit_price = prices[item.product_id].discounted,
                 ) for item in cart_items]
                 
             OrderItem.objects.bulk_create(order_items)
             
-            Cart.objects.get(pk=cart_id).delete()
+            deleted = Cart.objects.filter(pk=cart_id).delete()[1]
+            if deleted.get(Cart._meta.label) != 1:
+                raise serializers.ValidationError({'cart_id': ['This cart is not.']})
+            # Delivered to order_create receivers by the process_outbox worker.
+            OutboxEvent.objects.publish(OutboxEvent.TOPIC_ORDER_CREATED, {'order_id': order.id})
             return order
+
+    def get_shortages(self, quantities):
+        inventories = Product.objects.filter(pk__in=quantities).values_list('id', 'name', 'inventory')
+        return {
+            product_id: f'Not enough {name} in stock: {quantities[product_id]} requested, {max(inventory, 0)} available.'
+            for product_id, name, inventory in inventories
+            if inventory < quantities[product_id]
+        }
         
 
 class OrderUpdateSerailizer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
-            
\ No newline at end of file
+            
+
+
+class TopProductsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    category = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now().date())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=29))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'start must not be after end.'})
+        return attrs
+
+
+class TopProductSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
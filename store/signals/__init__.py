@@ -1,4 +1,15 @@
 from django.dispatch import Signal
 
 
-order_create = Signal()
\ No newline at end of file
+order_create = Signal()
+
+# Sent by ProductQuerySet bulk operations, which bypass model signals.
+# `product_ids` is None when the ids of newly inserted rows are unknown, or
+# when an update changed too many products to list (then `fields` is set);
+# `category_ids` are the categories whose product count may have changed and
+# `fields` the updated fields (None when whole rows were written). Updates
+# also send `modified_at`, the datetime_modified they set.
+products_bulk_changed = Signal()
+
+# Sent by CommentQuerySet.set_status, which moderates with one UPDATE.
+comments_bulk_changed = Signal()
@@ -1,11 +1,170 @@
-from django.db.models.signals import post_save
+from datetime import datetime
+
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 
-from store.models import Customer
+from store.authentication import user_cache
+from store.cache import response_cache
+from store.models import Category, Comment, Customer, Discount, Order, Product
+from store.sales import record_order
+from store.search import get_loaded_product_index
+from store.signals import comments_bulk_changed, order_create, products_bulk_changed
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_profile_for_newly_created_user(sender, instance, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=instance)
-        
\ No newline at end of file
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def evict_cached_user_on_change(sender, instance, **kwargs):
+    # Covers password changes too: set_password() is followed by save().
+    user_cache.delete(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def evict_cached_user_on_customer_change(sender, instance, **kwargs):
+    user_cache.delete(instance.user_id)
+
+
+@receiver(post_save, sender=Product)
+def update_category_products_count_on_save(sender, instance, created, **kwargs):
+    move = getattr(instance, '_category_move', None)
+    if move is not None:
+        previous_category_id, category_id = move
+        deltas = {category_id: 1}
+        if previous_category_id is not None:
+            deltas[previous_category_id] = -1
+        Category.objects.adjust_products_count(deltas)
+
+
+@receiver(post_delete, sender=Product)
+def update_category_products_count_on_delete(sender, instance, **kwargs):
+    Category.objects.adjust_products_count({instance.category_id: -1})
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_product_save(sender, instance, **kwargs):
+    index = get_loaded_product_index()
+    if index is not None:
+        index.add(instance.pk, instance.name, instance.description, instance.category.title)
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_product_delete(sender, instance, **kwargs):
+    index = get_loaded_product_index()
+    if index is not None:
+        index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def update_search_index_on_category_save(sender, instance, created, **kwargs):
+    index = get_loaded_product_index()
+    if index is not None and not created:
+        index.index_queryset(Product.objects.filter(category_id=instance.pk))
+
+
+@receiver(products_bulk_changed)
+def update_search_index_on_bulk_change(sender, product_ids, fields=None, modified_at=None, **kwargs):
+    index = get_loaded_product_index()
+    if index is None:
+        return
+    if fields is not None and not {'name', 'description', 'category', 'category_id'} & set(fields):
+        return
+    if product_ids is None:
+        if fields is None:
+            # New rows of unknown ids.
+            index.index_queryset(Product.objects.filter(pk__gt=index.max_id))
+        elif isinstance(modified_at, datetime):
+            # An update too wide to list its products: the rows it stamped.
+            index.index_queryset(Product.objects.filter(datetime_modified__gte=modified_at))
+        return
+    index.index_queryset(Product.objects.filter(pk__in=product_ids))
+    for product_id in set(product_ids) - set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)):
+        index.remove(product_id)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cache_on_product_save(sender, instance, created, **kwargs):
+    scopes = ['product:list', f'product:{instance.pk}']
+    move = getattr(instance, '_category_move', None)
+    if move is not None:
+        scopes += ['category:list', *[f'category:{category_id}' for category_id in move if category_id is not None]]
+    response_cache.invalidate(*scopes)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_cache_on_product_delete(sender, instance, **kwargs):
+    response_cache.invalidate(
+        'product:list', f'product:{instance.pk}', 'category:list', f'category:{instance.category_id}',
+    )
+
+
+@receiver(products_bulk_changed)
+def invalidate_cache_on_bulk_change(sender, product_ids, category_ids=(), fields=None, **kwargs):
+    if product_ids is None and fields is not None:
+        scopes = ['product:list', 'product:all']
+    else:
+        scopes = ['product:list', *[f'product:{product_id}' for product_id in product_ids or ()]]
+    if category_ids:
+        scopes += ['category:list', *[f'category:{category_id}' for category_id in category_ids]]
+    response_cache.invalidate(*scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cache_on_category_change(sender, instance, **kwargs):
+    response_cache.invalidate('category:list', f'category:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_cache_on_comment_change(sender, instance, **kwargs):
+    response_cache.invalidate('comment:list', f'comment:{instance.pk}', f'comment:product:{instance.product_id}')
+
+
+@receiver(comments_bulk_changed)
+def invalidate_cache_on_comments_bulk_change(sender, comment_ids, product_ids, **kwargs):
+    response_cache.invalidate(
+        'comment:list',
+        *[f'comment:{pk}' for pk in comment_ids],
+        *[f'comment:product:{product_id}' for product_id in product_ids],
+    )
+
+
+@receiver(m2m_changed, sender=Product.discounts.through)
+def invalidate_cache_on_product_discounts_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_product_ids = list(instance.product_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = getattr(instance, '_cleared_product_ids', [])
+    else:
+        product_ids = pk_set or []
+    response_cache.invalidate('product:list', *[f'product:{product_id}' for product_id in product_ids])
+
+
+@receiver(post_save, sender=Discount)
+@receiver(pre_delete, sender=Discount)
+def invalidate_cache_on_discount_change(sender, instance, **kwargs):
+    product_ids = Product.discounts.through.objects.filter(discount_id=instance.pk).values_list('product_id', flat=True)
+    response_cache.invalidate('product:list', *[f'product:{product_id}' for product_id in product_ids])
+
+
+@receiver(order_create)
+def record_sales_of_created_order(sender, order, **kwargs):
+    record_order(order.pk)
+
+
+@receiver(post_save, sender=Order)
+def record_sales_on_order_status_change(sender, instance, created, update_fields=None, **kwargs):
+    # New orders are counted when order_create is delivered by the outbox worker.
+    if created or (update_fields is not None and 'status' not in update_fields):
+        return
+    record_order(instance.pk)
@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import ANY, patch
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store import archive, factories, pricing, sales
+from store.authentication import user_cache
+from store.cache import response_cache
+from store.compiled import compile_serializer
+from store.models import (Address, Cart, CartItem, Category, CategoryDailySales, Comment, Customer, Discount, Order,
+                          OrderItem, OutboxEvent, Product, ProductDailySales, ProductQuerySet)
+from store.paginations import EstimatedCountPaginator
+from store.renderers import ORJSONRenderer
+from store.search import get_product_index, load_product_index, reset_product_index
+from store.serializers import OrderAdminSerializer, OrderSerializer, ProductSerializer
+
+
+@override_settings(PRODUCT_SEARCH_INDEX_PATH='/nonexistent/product_search_index.pickle')
+class ProductCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_product_index()
+        self.addCleanup(reset_product_index)
+        category = Category.objects.create(title='clothing')
+        for i in range(7):
+            Product.objects.create(name=f'shoe {i}', slug=f'shoe-{i}', category=category,
+                                   description='shoe ' * (i + 1), unit_price=10, inventory=5)
+        Product.objects.create(name='hat', slug='hat', category=category, description='', unit_price=10, inventory=5)
+        load_product_index()
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [product['id'] for product in response.json()['results']]
+            url = response.json()['next']
+        return ids
+
+    def test_cursor_pages_cover_every_product_once(self):
+        ids = self.walk('/store/products/?pagination=cursor&page_size=3')
+        self.assertEqual(ids, list(Product.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_cursor_pages_of_search_results(self):
+        first = self.client.get('/store/products/?search=shoe&pagination=cursor&page_size=3').json()
+        ids = self.walk('/store/products/?search=shoe&pagination=cursor&page_size=3')
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+        self.assertEqual(ids[:3], [product['id'] for product in first['results']])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/store/products/?cursor=eyJwIjpbIngiLCJ5Il19')
+        self.assertEqual(response.status_code, 404)
+
+
+class CommentStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                              unit_price=10, inventory=5)
+        self.client = APIClient()
+
+    def test_posted_comments_wait_for_moderation(self):
+        response = self.client.post(f'/store/products/{self.product.pk}/comment/',
+                                    {'name': 'a', 'body': 'b', 'status': Comment.COMMENT_STATUS_APPROVED})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], Comment.COMMENT_STATUS_WAITING)
+        self.assertEqual(Comment.objects.get().status, Comment.COMMENT_STATUS_WAITING)
+        self.assertEqual(self.client.get(f'/store/products/{self.product.pk}/comment/').json()['results'], [])
+
+
+class ResponseCacheVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(STORE_RESPONSE_CACHE_TIMEOUT=1)
+    def test_versions_expire_with_the_responses_built_on_them(self):
+        # A process that never sees a bump must not keep serving the old version.
+        versions = response_cache.get_versions(['product:list'])
+        self.assertEqual(response_cache.get_versions(['product:list']), versions)
+        time.sleep(1.1)
+        self.assertNotEqual(response_cache.get_versions(['product:list']), versions)
+
+
+class ProductBulkUpdateInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.products = [
+            Product.objects.create(name=f'hat {i}', slug=f'hat-{i}', category=category, description='',
+                                   unit_price=10, inventory=5)
+            for i in range(3)
+        ]
+        self.client = APIClient()
+
+    def get_inventory(self, product):
+        return self.client.get(f'/store/products/{product.pk}/').json()['inventory']
+
+    def test_small_updates_invalidate_each_product(self):
+        self.assertEqual(self.get_inventory(self.products[0]), 5)
+        versions = response_cache.get_versions(['product:all'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.products[0].pk).update(inventory=1)
+        self.assertEqual(self.get_inventory(self.products[0]), 1)
+        self.assertEqual(response_cache.get_versions(['product:all']), versions)
+
+    def test_wide_updates_invalidate_all_products(self):
+        for product in self.products:
+            self.assertEqual(self.get_inventory(product), 5)
+        with patch.object(ProductQuerySet, 'max_announced_ids', 2), self.captureOnCommitCallbacks(execute=True):
+            Product.objects.update(inventory=1)
+        self.assertEqual([self.get_inventory(product) for product in self.products], [1, 1, 1])
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='clothing')
+        admin = factories.CustomerFactory().user
+        admin.is_staff = True
+        admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def upload(self, query=''):
+        rows = (
+            'name,slug,category,unit_price,inventory\n'
+            f'winter hat,winter-hat,{self.category.pk},10,5\n'
+            f'short,short,{self.category.pk},10,5\n'
+        )
+        file = SimpleUploadedFile('products.csv', rows.encode(), content_type='text/csv')
+        return self.client.post(f'/store/products/import/{query}', {'file': file}, format='multipart')
+
+    def test_partial_imports_report_what_was_saved(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.json()['created'], response.json()['failed']), (1, 1))
+        self.assertEqual(response.json()['errors'][0]['row'], 2)
+        self.assertTrue(Product.objects.filter(slug='winter-hat').exists())
+
+    def test_atomic_imports_save_nothing_on_errors(self):
+        response = self.upload('?atomic=true')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['rolled_back'])
+        self.assertEqual(response.json()['created'], 0)
+        self.assertFalse(Product.objects.exists())
+
+
+class SalesAggregateTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='clothing')
+        self.product = Product.objects.create(name='hat', slug='hat', category=self.category, description='',
+                                              unit_price=10, inventory=100)
+        customer = factories.CustomerFactory()
+        for days_ago, status, quantity in [(20, 'p', 1), (9, 'u', 2), (9, 'c', 4), (1, 'p', 8)]:
+            order = Order.objects.create(customer=customer, status=status)
+            Order.objects.filter(pk=order.pk).update(datetime_created=datetime.now() - timedelta(days=days_ago))
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, unit_price=10)
+
+    def get_rows(self):
+        return (
+            list(ProductDailySales.objects.order_by('date').values_list('date', 'units', 'paid_units')),
+            list(CategoryDailySales.objects.order_by('date').values_list('date', 'units', 'revenue')),
+        )
+
+    def test_rebuild_in_batches_matches_recording_each_order(self):
+        for order_id in Order.objects.values_list('pk', flat=True):
+            sales.record_order(order_id)
+        expected = self.get_rows()
+        self.assertEqual(len(expected[0]), 3)
+        ProductDailySales.objects.filter(date=expected[0][0][0]).update(units=99)
+        ProductDailySales.objects.create(date=date.today() - timedelta(days=30), product=self.product,
+                                         category=self.category)
+
+        sales.rebuild(days=2)
+        self.assertEqual(self.get_rows(), expected)
+        self.assertFalse(Order.objects.exclude(sales_status=F('status')).exists())
+
+    def test_categories_without_recent_sales_lose_their_top_product(self):
+        stale = Category.objects.create(title='hats', top_product=self.product)
+        sales.rebuild()
+        self.assertEqual(sales.update_top_products(days=30), 1)
+        self.category.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual(self.category.top_product, self.product)
+        self.assertIsNone(stale.top_product)
+
+
+class ArchivedOrderItemsTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                         unit_price=10, inventory=100)
+        self.owner = factories.CustomerFactory()
+        order = Order.objects.create(customer=self.owner, status=Order.ORDER_STATUS_PAID)
+        self.item = OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=10)
+        sales.record_order(order.pk)
+        self.assertEqual(archive.archive_orders(datetime.now() + timedelta(days=1)), (1, ANY))
+        self.url = f'/store/orders/{order.pk}/items/'
+        self.client = APIClient()
+
+    def test_owners_see_their_archived_items(self):
+        self.client.force_authenticate(self.owner.user)
+        self.assertEqual([item['id'] for item in self.client.get(self.url).json()], [self.item.pk])
+        self.assertEqual(self.client.get(f'{self.url}{self.item.pk}/').status_code, 200)
+
+    def test_other_customers_do_not(self):
+        self.client.force_authenticate(factories.CustomerFactory().user)
+        self.assertEqual(self.client.get(self.url).json(), [])
+        self.assertEqual(self.client.get(f'{self.url}{self.item.pk}/').status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class OrderItemsAccessTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                         unit_price=10, inventory=100)
+        self.owner = factories.CustomerFactory()
+        order = Order.objects.create(customer=self.owner)
+        self.item = OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=10)
+        self.url = f'/store/orders/{order.pk}/items/'
+        self.client = APIClient()
+
+    def test_live_items_are_only_shown_to_their_customer_and_staff(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_authenticate(factories.CustomerFactory().user)
+        self.assertEqual(self.client.get(self.url).json(), [])
+        self.assertEqual(self.client.get(f'{self.url}{self.item.pk}/').status_code, 404)
+        self.client.force_authenticate(self.owner.user)
+        self.assertEqual([item['id'] for item in self.client.get(self.url).json()], [self.item.pk])
+        staff = factories.UserFactory(is_staff=True)
+        self.client.force_authenticate(staff)
+        self.assertEqual(self.client.get(f'{self.url}{self.item.pk}/').status_code, 200)
+
+    def test_items_are_read_only(self):
+        self.client.force_authenticate(self.owner.user)
+        self.assertEqual(self.client.patch(f'{self.url}{self.item.pk}/', {'quantity': 50}).status_code, 405)
+        self.assertEqual(self.client.delete(f'{self.url}{self.item.pk}/').status_code, 405)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 2)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.hat = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                          unit_price=10, inventory=5)
+        self.scarf = Product.objects.create(name='scarf', slug='scarf', category=category, description='',
+                                            unit_price=20, inventory=1)
+        self.customer = factories.CustomerFactory()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer.user)
+
+    def checkout(self, quantities):
+        cart = Cart.objects.create()
+        for product, quantity in quantities.items():
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return cart, self.client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json')
+
+    def get_inventories(self):
+        return list(Product.objects.order_by('pk').values_list('inventory', flat=True))
+
+    def test_reserve_inventory_takes_stock_only_if_every_product_has_enough(self):
+        self.assertTrue(Product.objects.reserve_inventory({self.hat.pk: 2, self.scarf.pk: 1}))
+        self.assertEqual(self.get_inventories(), [3, 0])
+        self.assertFalse(Product.objects.reserve_inventory({self.hat.pk: 1, self.scarf.pk: 1}))
+        self.assertTrue(Product.objects.reserve_inventory({}))
+
+    def test_checkout_turns_the_cart_into_an_order(self):
+        cart, response = self.checkout({self.hat: 2, self.scarf: 1})
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(sorted(order.items.values_list('product_id', 'quantity')),
+                         [(self.hat.pk, 2), (self.scarf.pk, 1)])
+        self.assertEqual(self.get_inventories(), [3, 0])
+        self.assertFalse(Cart.objects.filter(pk=cart.pk).exists())
+        self.assertEqual(OutboxEvent.objects.get().payload, {'order_id': order.pk})
+
+    def test_a_short_product_cancels_the_whole_checkout(self):
+        cart, response = self.checkout({self.hat: 2, self.scarf: 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['out_of_stock']), [str(self.scarf.pk)])
+        self.assertEqual(self.get_inventories(), [5, 1])
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.filter(cart=cart).exists())
+
+    def test_empty_and_missing_carts_are_rejected(self):
+        _, response = self.checkout({})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/store/orders/', {'cart_id': str(uuid4())}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OutboxClaimTests(TestCase):
+    def setUp(self):
+        self.events = [OutboxEvent.objects.publish(OutboxEvent.TOPIC_ORDER_CREATED, {'order_id': i}) for i in range(5)]
+
+    def claimed_ids(self, worker, limit):
+        return [event.pk for event in OutboxEvent.objects.claim(worker, limit, lease_seconds=60)]
+
+    def test_workers_lease_disjoint_batches(self):
+        first = self.claimed_ids('a', 3)
+        second = self.claimed_ids('b', 3)
+        self.assertEqual(first, [event.pk for event in self.events[:3]])
+        self.assertEqual(second, [event.pk for event in self.events[3:]])
+        self.assertEqual(self.claimed_ids('c', 3), [])
+
+    def test_expired_leases_and_due_retries_are_claimed_again(self):
+        self.claimed_ids('a', 5)
+        OutboxEvent.objects.filter(pk=self.events[0].pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        OutboxEvent.objects.filter(pk=self.events[1].pk).update(
+            locked_until=None, available_at=timezone.now() + timedelta(minutes=1),
+        )
+        self.assertEqual(self.claimed_ids('b', 5), [self.events[0].pk])
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class OutboxSkipLockedTests(TransactionTestCase):
+    def test_claim_passes_over_rows_another_worker_has_locked(self):
+        events = [OutboxEvent.objects.publish(OutboxEvent.TOPIC_ORDER_CREATED, {'order_id': i}) for i in range(4)]
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_first_rows():
+            try:
+                with transaction.atomic():
+                    list(OutboxEvent.objects.select_for_update().filter(pk__in=[events[0].pk, events[1].pk]))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_first_rows)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            claimed = OutboxEvent.objects.claim('b', 4, lease_seconds=60)
+            self.assertEqual([event.pk for event in claimed], [events[2].pk, events[3].pk])
+        finally:
+            release.set()
+            thread.join()
+
+
+class ResponseCacheValidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                              unit_price=10, inventory=5)
+        self.url = f'/store/products/{self.product.pk}/'
+        self.client = APIClient()
+
+    def test_etags_revalidate_until_the_product_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.inventory = 2
+            self.product.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inventory'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_waits_for_the_second_of_the_change_to_pass(self):
+        now = int(time.time())
+        with patch('store.cache.time.time', return_value=now + 0.5):
+            # A change later in this second would carry the same Last-Modified.
+            self.assertNotIn('Last-Modified', self.client.get(self.url))
+        with patch('store.cache.time.time', return_value=now + 1):
+            last_modified = self.client.get(self.url)['Last-Modified']
+            self.assertEqual(last_modified, http_date(now))
+            self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=self.product.pk).update(inventory=2)
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Last-Modified', response)
+
+    def test_lists_are_invalidated_by_changes_to_their_products(self):
+        self.assertEqual(self.client.get('/store/products/').json()['results'][0]['name'], 'hat')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='beret')
+        self.assertEqual(self.client.get('/store/products/').json()['results'][0]['name'], 'beret')
+
+
+class CartExpiryTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        self.product = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                              unit_price=10, inventory=5)
+        self.old = timezone.now() - timedelta(days=40)
+
+    def create_cart(self, updated_at):
+        cart = Cart.objects.create(updated_at=updated_at)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return cart
+
+    def test_only_carts_untouched_since_the_cutoff_are_deleted(self):
+        expired = [self.create_cart(self.old) for _ in range(3)]
+        fresh = self.create_cart(timezone.now())
+        cutoff = timezone.now() - timedelta(days=30)
+
+        after, carts, items = Cart.objects.delete_expired(cutoff, limit=2)
+        self.assertEqual((carts, items), (2, 2))
+        self.assertEqual(after, sorted(cart.pk for cart in expired)[1])
+        self.assertEqual(Cart.objects.delete_expired(cutoff, limit=2, after=after)[1:], (1, 1))
+        self.assertEqual(Cart.objects.delete_expired(cutoff, limit=2), (None, 0, 0))
+        self.assertEqual(list(Cart.objects.all()), [fresh])
+        self.assertEqual(CartItem.objects.get().cart, fresh)
+
+    def test_adding_items_touches_the_cart(self):
+        cart = self.create_cart(self.old)
+        response = APIClient().post(f'/store/carts/{cart.pk}/items/', {'product': self.product.pk, 'quantity': 1})
+        self.assertEqual(response.status_code, 201)
+        call_command('expire_carts', days=30, pause=0, stdout=StringIO())
+        self.assertTrue(Cart.objects.filter(pk=cart.pk).exists())
+
+
+class CategoryProductsCountTests(TestCase):
+    def setUp(self):
+        self.hats = Category.objects.create(title='hats')
+        self.shoes = Category.objects.create(title='shoes')
+
+    def create_product(self, category, name='hat'):
+        return Product.objects.create(name=name, slug=name, category=category, description='', unit_price=10,
+                                      inventory=5)
+
+    def assertCounts(self, hats, shoes):
+        self.assertEqual(
+            list(Category.objects.filter(pk__in=[self.hats.pk, self.shoes.pk]).order_by('pk')
+                 .values_list('products_count', flat=True)),
+            [hats, shoes],
+        )
+        # What `recount_products` (the repair command) would set.
+        self.assertEqual([Product.objects.filter(category=self.hats).count(),
+                          Product.objects.filter(category=self.shoes).count()], [hats, shoes])
+
+    def test_save_move_and_delete(self):
+        product = self.create_product(self.hats)
+        self.assertCounts(1, 0)
+        product.inventory = 3
+        product.save()
+        self.assertCounts(1, 0)
+        product.category = self.shoes
+        product.save()
+        self.assertCounts(0, 1)
+        product.delete()
+        self.assertCounts(0, 0)
+
+    def test_saves_of_products_loaded_without_their_category(self):
+        product = self.create_product(self.hats)
+        deferred = Product.objects.only('name').get(pk=product.pk)
+        deferred.name = 'beret'
+        deferred.save()
+        self.assertCounts(1, 0)
+        deferred = Product.objects.defer('category').get(pk=product.pk)
+        deferred.category = self.shoes
+        deferred.save()
+        self.assertCounts(0, 1)
+
+    def test_saves_that_leave_the_category_out(self):
+        product = self.create_product(self.hats)
+        product.category = self.shoes
+        product.save(update_fields=['name'])
+        self.assertCounts(1, 0)
+
+    def test_bulk_operations(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'hat {i}', slug=f'hat-{i}', category=self.hats, description='', unit_price=10, inventory=5)
+            for i in range(3)
+        ])
+        self.assertCounts(3, 0)
+        products[0].category = self.shoes
+        Product.objects.bulk_update(products[:1], ['category'])
+        self.assertCounts(2, 1)
+        Product.objects.filter(pk=products[1].pk).update(category=self.shoes)
+        self.assertCounts(1, 2)
+        Product.objects.filter(category=self.hats).update(inventory=0)
+        self.assertCounts(1, 2)
+
+
+@override_settings(PRODUCT_SEARCH_INDEX_PATH='/nonexistent/product_search_index.pickle')
+class ProductSearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_product_index()
+        self.addCleanup(reset_product_index)
+        self.category = Category.objects.create(title='clothing')
+        self.products = [
+            Product.objects.create(name=f'woolly hat {i}', slug=f'hat-{i}', category=self.category, description='',
+                                   unit_price=10, inventory=5)
+            for i in range(3)
+        ]
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get('/store/products/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return sorted(product['id'] for product in response.json()['results'])
+
+    def test_requests_never_build_the_index(self):
+        self.assertEqual(self.search('woolly'), [product.pk for product in self.products])
+        self.assertIsNone(get_product_index())
+
+    def test_wide_updates_reindex_the_rows_they_changed(self):
+        load_product_index()
+        with patch.object(ProductQuerySet, 'max_announced_ids', 1):
+            Product.objects.filter(pk__in=[product.pk for product in self.products[:2]]).update(name='beret')
+        self.assertEqual(self.search('beret'), [product.pk for product in self.products[:2]])
+        self.assertEqual(self.search('woolly'), [self.products[2].pk])
+
+    def test_changes_made_by_other_processes_are_caught_up_with(self):
+        load_product_index()
+        # Another process: this one's signals don't see the change.
+        with patch('store.signals.handlers.get_loaded_product_index', return_value=None):
+            Product.objects.filter(pk=self.products[0].pk).update(name='beret')
+        self.assertEqual(self.search('beret'), [])
+        cache.clear()
+        with override_settings(PRODUCT_SEARCH_REFRESH_SECONDS=0):
+            self.assertEqual(self.search('beret'), [self.products[0].pk])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.customer = factories.CustomerFactory()
+        self.user = self.customer.user
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def get_orders(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/store/orders/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_users_are_loaded_once_with_their_customer(self):
+        misses, hits = user_cache.stats['misses'], user_cache.stats['hits']
+        first = self.get_orders()
+        self.assertEqual(self.get_orders(), first - 1)
+        self.assertEqual((user_cache.stats['misses'], user_cache.stats['hits']), (misses + 1, hits + 1))
+
+    def test_user_customer_and_password_changes_evict_the_user(self):
+        changes = [
+            lambda: self.user.save(),
+            lambda: self.customer.save(),
+            lambda: (self.user.set_password('new password'), self.user.save()),
+        ]
+        for change in changes:
+            self.get_orders()
+            self.assertIsNotNone(user_cache.get(self.user.pk))
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertIsNone(user_cache.get(self.user.pk))
+
+        self.get_orders()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.delete()
+            self.user.delete()
+        self.assertEqual(self.client.get('/store/orders/').status_code, 401)
+
+    @override_settings(QUERY_BUDGET_ACTION='raise')
+    def test_checkout_stays_within_its_query_budget(self):
+        category = Category.objects.create(title='clothing')
+        cart = Cart.objects.create()
+        for i in range(3):
+            product = Product.objects.create(name=f'hat {i}', slug=f'hat-{i}', category=category, description='',
+                                             unit_price=10, inventory=5)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        response = self.client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 3)
+
+
+class CartItemsTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        self.hat = Product.objects.create(name='hat', slug='hat', category=category, description='',
+                                          unit_price=10, inventory=5)
+        self.scarf = Product.objects.create(name='scarf', slug='scarf', category=category, description='',
+                                            unit_price=20, inventory=5)
+        self.cart = Cart.objects.create()
+        self.url = f'/store/carts/{self.cart.pk}/items/'
+        self.client = APIClient()
+
+    def get_quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def batch(self, items):
+        return self.client.post(f'{self.url}batch/', {'items': items}, format='json')
+
+    def test_adding_a_product_again_adds_to_its_quantity(self):
+        CartItem.objects.add_items(self.cart.pk, {self.hat.pk: 2})
+        response = self.client.post(self.url, {'product': self.hat.pk, 'quantity': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['quantity'], 5)
+        self.assertEqual(self.get_quantities(), {self.hat.pk: 5})
+
+    def test_batches_sum_repeated_products_into_the_cart(self):
+        CartItem.objects.add_items(self.cart.pk, {self.hat.pk: 1})
+        response = self.batch([
+            {'product': self.hat.pk, 'quantity': 2},
+            {'product': self.scarf.pk, 'quantity': 1},
+            {'product': self.hat.pk, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({item['product']['id']: item['quantity'] for item in response.json()},
+                         {self.hat.pk: 6, self.scarf.pk: 1})
+        self.assertEqual(self.get_quantities(), {self.hat.pk: 6, self.scarf.pk: 1})
+
+    def test_batches_of_unknown_products_are_rejected(self):
+        response = self.batch([{'product': self.hat.pk, 'quantity': 1}, {'product': 0, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_quantities(), {})
+
+    def test_quantities_past_the_column_limit_are_rejected(self):
+        CartItem.objects.add_items(self.cart.pk, {self.hat.pk: 32000})
+        response = self.batch([{'product': self.hat.pk, 'quantity': 500}, {'product': self.hat.pk, 'quantity': 500}])
+        self.assertEqual(response.status_code, 400)
+        response = self.batch([{'product': self.scarf.pk, 'quantity': 32767}, {'product': self.scarf.pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'product': self.hat.pk, 'quantity': 1000})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_quantities(), {self.hat.pk: 32000})
+
+        response = self.batch([{'product': self.hat.pk, 'quantity': 767}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_quantities(), {self.hat.pk: 32767})
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        self.hat = Product.objects.create(name='hat, woolly', slug='hat', category=category, description='',
+                                          unit_price=10, inventory=5)
+        self.scarf = Product.objects.create(name='scarf', slug='scarf', category=category, description='',
+                                            unit_price=20, inventory=5)
+        self.customer = factories.CustomerFactory()
+        self.paid = Order.objects.create(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        OrderItem.objects.create(order=self.paid, product=self.hat, quantity=2, unit_price='9.50')
+        OrderItem.objects.create(order=self.paid, product=self.scarf, quantity=1, unit_price='20.00')
+        self.unpaid = Order.objects.create(customer=self.customer)
+        self.client = APIClient()
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+
+    def export(self, **params):
+        response = self.client.get('/store/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content).decode()
+        # The orders, then their items with products: not a query per order.
+        self.assertEqual(len(queries), 2)
+        return response, content
+
+    def test_csv_has_a_line_per_order_item(self):
+        response, content = self.export(type='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['order_id', 'datetime_created', 'status', 'customer_id', 'customer_email',
+                                   'item_id', 'product_id', 'product_name', 'quantity', 'unit_price'])
+        email = self.customer.user.email
+        self.assertEqual([row[:5] for row in rows[1:]], [
+            [str(self.paid.pk), str(self.paid.datetime_created), 'p', str(self.customer.pk), email],
+            [str(self.paid.pk), str(self.paid.datetime_created), 'p', str(self.customer.pk), email],
+            [str(self.unpaid.pk), str(self.unpaid.datetime_created), 'u', str(self.customer.pk), email],
+        ])
+        self.assertEqual([row[6:] for row in rows[1:]], [
+            [str(self.hat.pk), 'hat, woolly', '2', '9.50'],
+            [str(self.scarf.pk), 'scarf', '1', '20.00'],
+            ['', '', '', ''],
+        ])
+
+    def test_ndjson_has_an_object_per_order(self):
+        response, content = self.export(type='ndjson', status=Order.ORDER_STATUS_PAID)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.ndjson"')
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 1)
+        order = json.loads(lines[0])
+        self.assertEqual(order['id'], self.paid.pk)
+        self.assertEqual(order['customer_email'], self.customer.user.email)
+        self.assertEqual([(item['product_name'], item['quantity'], item['unit_price']) for item in order['items']],
+                         [('hat, woolly', 2, '9.50'), ('scarf', 1, '20.00')])
+
+    def test_only_staff_export_orders(self):
+        self.client.force_authenticate(self.customer.user)
+        self.assertEqual(self.client.get('/store/orders/export/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/store/orders/export/').status_code, 401)
+
+    def test_unknown_formats_and_filters_are_rejected(self):
+        self.assertEqual(self.client.get('/store/orders/export/', {'type': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get('/store/orders/export/', {'status': 'x'}).status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+        self.hat = Product.objects.create(name='woolly hat', slug='hat', category=category,
+                                          description='warm ' * 100, unit_price=10, inventory=5)
+        self.customer = factories.CustomerFactory()
+        order = Order.objects.create(customer=self.customer)
+        OrderItem.objects.create(order=order, product=self.hat, quantity=1, unit_price=10)
+        self.client = APIClient()
+
+    def get(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, [query['sql'] for query in queries]
+
+    def test_fields_and_exclude_shape_the_response(self):
+        response, _ = self.get('/store/products/', fields='id,name')
+        self.assertEqual(response.json()['results'], [{'id': self.hat.pk, 'name': 'woolly hat'}])
+        response, _ = self.get(f'/store/products/{self.hat.pk}/', fields='id,inventory')
+        self.assertEqual(response.json(), {'id': self.hat.pk, 'inventory': 5})
+        response, _ = self.get('/store/products/', exclude='description,category')
+        self.assertEqual(list(response.json()['results'][0]),
+                         ['id', 'name', 'unit_price', 'discounted_price', 'price_after_tax', 'inventory'])
+
+    def test_unknown_fields_are_rejected(self):
+        response, _ = self.get('/store/products/', fields='id,colour')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown fields: colour.']})
+        response, _ = self.get(f'/store/products/{self.hat.pk}/', exclude='size')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'exclude': ['Unknown fields: size.']})
+
+    def test_left_out_fields_are_not_read(self):
+        response, full = self.get('/store/products/')
+        self.assertTrue(any('"description"' in sql for sql in full))
+        response, sparse = self.get('/store/products/', fields='id,name')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('"description"' in sql for sql in sparse))
+        # No prices, so no discount lookup.
+        self.assertEqual(len(sparse), len(full) - 1)
+
+    def test_left_out_relations_are_not_prefetched(self):
+        self.client.force_authenticate(self.customer.user)
+        response, full = self.get('/store/orders/')
+        self.assertEqual(len(response.json()['results'][0]['items']), 1)
+        response, sparse = self.get('/store/orders/', fields='id,datetime_created')
+        self.assertEqual(list(response.json()['results'][0]), ['id', 'datetime_created'])
+        self.assertFalse(any('store_orderitem' in sql for sql in sparse))
+        self.assertLess(len(sparse), len(full))
+
+
+class CompiledSerializerParityTests(TestCase):
+    def setUp(self):
+        self.categories = [Category.objects.create(title='clothing'), Category.objects.create(title='chapeaux ☂')]
+        prices = ['9.99', '0.05', '1000.10', '19.95', '3333.33']
+        self.products = [
+            Product.objects.create(name=f'hat {i}   “{i}”', slug=f'hat-{i}', category=self.categories[i % 2],
+                                   description='line\nbreak "quoted" </script>', unit_price=price, inventory=i - 2)
+            for i, price in enumerate(prices)
+        ]
+        discounts = [Discount.objects.create(discount=d, description='') for d in (0.15, 0.333, 0.5)]
+        self.products[0].discounts.add(discounts[0], discounts[1])
+        self.products[3].discounts.add(discounts[2])
+        self.categories[0].top_product = self.products[0]
+        self.categories[0].save()
+
+        customer = factories.CustomerFactory(birth_date=None)
+        for i in range(3):
+            order = Order.objects.create(customer=customer, status=Order.ORDER_STATUS[i][0])
+            Order.objects.filter(pk=order.pk).update(datetime_created=datetime(2024, 2, 29, 23, 59, 59, 999999 - i))
+            for product in self.products[i:i + 2 * i]:
+                OrderItem.objects.create(order=order, product=product, quantity=i + 1, unit_price=product.unit_price)
+
+    def assertSameBytes(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        compiled = compile_serializer(serializer_class)
+        actual = ORJSONRenderer().render(compiled.serialize(compiled.prepare(queryset)))
+        self.assertEqual(actual, expected)
+
+    def test_products(self):
+        self.assertSameBytes(ProductSerializer, Product.objects.all())
+
+    def test_orders(self):
+        queryset = Order.objects.order_by('pk')
+        self.assertSameBytes(OrderSerializer, queryset)
+        self.assertSameBytes(OrderAdminSerializer, queryset)
+
+    def test_nulls(self):
+        class CategoryTopProductSerializer(ModelSerializer):
+            class Meta:
+                model = Category
+                fields = ['id', 'title', 'top_product']
+
+        class CustomerBirthDateSerializer(ModelSerializer):
+            class Meta:
+                model = Customer
+                fields = ['id', 'birth_date', 'phone_number']
+
+        self.assertSameBytes(CategoryTopProductSerializer, Category.objects.order_by('pk'))
+        factories.CustomerFactory(birth_date=date(2000, 1, 31))
+        self.assertSameBytes(CustomerBirthDateSerializer, Customer.objects.order_by('pk'))
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(title='clothing')
+
+        def create(name, unit_price, *discounts):
+            product = Product.objects.create(name=name, slug=name, category=category, description='',
+                                             unit_price=unit_price, inventory=10)
+            product.discounts.add(*[Discount.objects.create(discount=d, description='') for d in discounts])
+            return product
+
+        self.hat = create('hat', '9.99', 0.15, 0.333)
+        self.pin = create('pin', '0.05', 0.5)
+        self.sock = create('sock', '0.50')
+        self.gift = create('gift', '20.00', 1.5)
+
+    def test_the_best_discount_applies_then_tax_rounds_half_up(self):
+        prices = pricing.get_prices(Product.objects.all())
+        self.assertEqual(
+            {pk: (price.discount, price.discounted, price.after_tax) for pk, price in prices.items()},
+            {
+                self.hat.pk: (Decimal('0.333'), Decimal('6.66'), Decimal('7.26')),
+                self.pin.pk: (Decimal('0.5'), Decimal('0.03'), Decimal('0.03')),
+                self.sock.pk: (Decimal('0'), Decimal('0.50'), Decimal('0.55')),
+                self.gift.pk: (Decimal('1'), Decimal('0.00'), Decimal('0.00')),
+            },
+        )
+        self.assertEqual(pricing.get_prices([self.sock], tax_rate=Decimal('0.2'))[self.sock.pk].after_tax,
+                         Decimal('0.60'))
+        with override_settings(STORE_TAX_RATE='0.07'):
+            self.assertEqual(pricing.get_prices([self.sock])[self.sock.pk].after_tax, Decimal('0.54'))
+
+    def test_attach_prices_reads_discounts_once_per_batch(self):
+        products = list(Product.objects.all())
+        with self.assertNumQueries(1):
+            pricing.attach_prices(products)
+        with self.assertNumQueries(0):
+            pricing.attach_prices(products)
+            self.assertEqual(pricing.get_price(products[0]).discounted, Decimal('6.66'))
+        self.assertEqual(pricing.attach_prices([]), [])
+
+    def test_carts_and_checkout_charge_the_discounted_price(self):
+        cart = Cart.objects.create()
+        CartItem.objects.add_items(cart.pk, {self.hat.pk: 2, self.sock.pk: 3})
+        client = APIClient()
+        items = client.get(f'/store/carts/{cart.pk}/items/').json()
+        self.assertEqual(sorted((item['product']['id'], item['unit_price'], item['total_price']) for item in items),
+                         [(self.hat.pk, 6.66, 13.32), (self.sock.pk, 0.5, 1.5)])
+        self.assertEqual(client.get(f'/store/carts/{cart.pk}/').json()['total_price'], 14.82)
+
+        client.force_authenticate(factories.CustomerFactory().user)
+        response = client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(OrderItem.objects.values_list('product_id', 'unit_price')),
+                         [(self.hat.pk, Decimal('6.66')), (self.sock.pk, Decimal('0.50'))])
+        self.assertEqual(sorted(item['unit_price'] for item in response.json()['items']), [0.5, 6.66])
+
+
+class OrderViewSetTests(TestCase):
+    def setUp(self):
+        self.customer = factories.CustomerFactory()
+        other = factories.CustomerFactory()
+        self.other_order = Order.objects.create(customer=other)
+        start = datetime(2024, 1, 1)
+        self.orders = []
+        for i in range(45):
+            order = Order.objects.create(customer=self.customer, status=Order.ORDER_STATUS[i % 3][0])
+            # Pairs of orders share a timestamp, so pages must break ties by pk.
+            Order.objects.filter(pk=order.pk).update(datetime_created=start + timedelta(hours=i // 2))
+            order.refresh_from_db()
+            self.orders.append(order)
+        self.newest_first = sorted(self.orders, key=lambda order: (order.datetime_created, order.pk), reverse=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer.user)
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, params=None):
+        page = self.get('/store/orders/', params)
+        ids = [order['id'] for order in page['results']]
+        while page['next']:
+            page = self.get(page['next'])
+            ids += [order['id'] for order in page['results']]
+        return ids
+
+    def test_customers_page_through_their_orders_newest_first(self):
+        self.assertEqual(self.walk(), [order.pk for order in self.newest_first])
+
+    def test_cursors_are_stable_under_inserts_and_deletes(self):
+        first = self.get('/store/orders/')
+        self.assertEqual([order['id'] for order in first['results']], [order.pk for order in self.newest_first[:20]])
+        new = Order.objects.create(customer=self.customer)
+        self.newest_first[0].delete()
+        second = self.get(first['next'])
+        self.assertEqual([order['id'] for order in second['results']], [order.pk for order in self.newest_first[20:40]])
+        # Back from the second page: the 20 orders now before it.
+        previous = self.get(second['previous'])
+        self.assertEqual([order['id'] for order in previous['results']],
+                         [new.pk] + [order.pk for order in self.newest_first[1:20]])
+
+    def test_filters(self):
+        self.assertEqual(self.walk({'status': Order.ORDER_STATUS_PAID}),
+                         [order.pk for order in self.newest_first if order.status == Order.ORDER_STATUS_PAID])
+        after, before = datetime(2024, 1, 1, 5), datetime(2024, 1, 1, 10)
+        self.assertEqual(self.walk({'created_after': after.isoformat(), 'created_before': before.isoformat()}),
+                         [order.pk for order in self.newest_first if after <= order.datetime_created < before])
+        self.assertEqual(self.client.get('/store/orders/', {'status': 'x'}).status_code, 400)
+
+    def test_staff_see_every_order(self):
+        self.client.force_authenticate(factories.UserFactory(is_staff=True))
+        self.assertEqual(self.walk(), [self.other_order.pk] + [order.pk for order in self.newest_first])
+
+    def test_users_without_a_customer_are_forbidden(self):
+        user = factories.UserFactory()
+        Customer.objects.filter(user=user).delete()
+        user = type(user).objects.get(pk=user.pk)
+        self.client.force_authenticate(user)
+        order = self.orders[0]
+        for url in ['/store/orders/', f'/store/orders/{order.pk}/', f'/store/orders/{order.pk}/items/',
+                    '/store/customers/me/']:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+        self.assertEqual(self.client.post('/store/orders/', {'cart_id': str(uuid4())}, format='json').status_code, 403)
+
+        user.is_staff = True
+        self.assertEqual(self.client.get('/store/orders/').status_code, 200)
+        self.assertEqual(self.client.post('/store/orders/', {'cart_id': str(uuid4())}, format='json').status_code, 403)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='clothing')
+        products = [
+            Product.objects.create(name=f'hat {i}', slug=f'hat-{i}', category=category, description='',
+                                   unit_price=10, inventory=5)
+            for i in range(12)
+        ]
+        # The estimate (SQLite without ANALYZE: the highest rowid) now differs from the count.
+        Product.objects.filter(pk__in=[product.pk for product in products[:2]]).delete()
+        self.client.force_login(factories.UserFactory(is_staff=True, is_superuser=True))
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/store/product/', params)
+        self.assertEqual(response.status_code, 200)
+        counts = [query['sql'] for query in queries if 'COUNT(*)' in query['sql']]
+        return response.context['cl'], counts
+
+    def test_large_tables_use_the_estimate(self):
+        with patch.object(EstimatedCountPaginator, 'exact_count_threshold', 5):
+            cl, counts = self.changelist()
+        self.assertEqual(cl.result_count, 12)
+        self.assertEqual(cl.paginator.num_pages, 1)
+        self.assertEqual(counts, [])
+
+    def test_small_tables_and_filtered_lists_count_exactly(self):
+        cl, counts = self.changelist()
+        self.assertEqual(cl.result_count, 10)
+        self.assertEqual(len(counts), 1)
+        with patch.object(EstimatedCountPaginator, 'exact_count_threshold', 5):
+            cl, counts = self.changelist(q='hat 1')
+        self.assertEqual(cl.result_count, 2)
+        self.assertEqual(len(counts), 1)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='clothing')
+        self.products = [
+            Product.objects.create(name=f'hat {i}', slug=f'hat-{i}', category=self.category, description='warm',
+                                   unit_price=f'{i}9.99', inventory=i)
+            for i in range(12)
+        ]
+        self.products[0].discounts.add(Discount.objects.create(discount=0.25, description=''))
+        for i in range(3):
+            Comment.objects.create(product=self.products[0], name='me', body=f'nice {i}',
+                                   status=Comment.COMMENT_STATUS_APPROVED)
+        self.client = APIClient()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertSameAsSync(self, path, params=None):
+        sync = self.get(f'/store/{path}', params).json()
+        response = self.get(f'/store/async/{path}', params)
+        data = response.json()
+        if isinstance(sync, dict):
+            for link in ('next', 'previous'):
+                if sync.get(link):
+                    sync[link] = sync[link].replace('/store/', '/store/async/', 1)
+        self.assertEqual(data, sync)
+        return response
+
+    def test_responses_match_the_sync_views(self):
+        pk = self.products[0].pk
+        first = self.assertSameAsSync('products/')
+        self.assertSameAsSync('products/', {'category_id': self.category.pk, 'ordering': '-inventory'})
+        self.assertSameAsSync('products/', {'fields': 'id,discounted_price'})
+        next_page = {name: values[0] for name, values in parse_qs(urlparse(first.json()['next']).query).items()}
+        self.assertSameAsSync('products/', next_page)
+        self.assertSameAsSync(f'products/{pk}/')
+        self.assertSameAsSync(f'products/{pk}/comment/')
+        self.assertSameAsSync('categories/')
+
+    def test_errors_match_the_sync_views(self):
+        for path, params in [('products/0/', None), ('products/', {'page': 99}),
+                             ('products/', {'fields': 'colour'})]:
+            sync = self.client.get(f'/store/{path}', params)
+            response = self.client.get(f'/store/async/{path}', params)
+            self.assertEqual((response.status_code, response.json()), (sync.status_code, sync.json()))
+        self.assertEqual(self.client.post('/store/async/products/', {}).status_code, 405)
+
+    def test_responses_are_cached_until_invalidated(self):
+        url = f'/store/async/products/{self.products[0].pk}/'
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.products[0].pk).update(inventory=99)
+        response = self.get(url)
+        self.assertEqual((response['X-Cache'], response.json()['inventory']), ('MISS', 99))
+        self.assertEqual(self.get('/store/async/products/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/store/async/products/')['X-Cache'], 'HIT')
+
+
+class SetupFakeDataTests(TestCase):
+    def run_command(self):
+        call_command('setup_fake_data', scale=0.02, seed=7, stdout=StringIO())
+        models = [Category, Discount, Product, Customer, Address, Order, OrderItem, Comment, Cart, CartItem]
+        counts = {model.__name__: model.objects.count() for model in models}
+        return counts, list(Product.objects.order_by('pk').values_list('name', 'unit_price', 'category__title'))
+
+    def test_reruns_with_the_same_seed_produce_the_same_data(self):
+        first = self.run_command()
+        self.assertTrue(all(first[0].values()), first[0])
+        self.assertEqual(self.run_command(), first)
@@ -1,7 +1,7 @@
 from django.urls import path
 from rest_framework_nested import routers
 
-from . import views
+from . import async_views, views
 
 router = routers.DefaultRouter()
 
@@ -22,4 +22,13 @@ cart_cart_item_router.register('items', views.CartItemViewSet, 'cart-items')
 order_items_router = routers.NestedSimpleRouter(router, 'orders', lookup='order')
 order_items_router.register('items', views.OrderItemsViewSet, basename='order-items')
 
-urlpatterns = router.urls + products_comment_router.urls + cart_cart_item_router.urls + order_items_router.urls
+urlpatterns = [
+    path('cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    # Async copies of the read-only catalog routes, for ASGI deployments.
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/products/<int:product_pk>/comment/', async_views.product_comment_list, name='async-comment-product-list'),
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+]
+
+urlpatterns += router.urls + products_comment_router.urls + cart_cart_item_router.urls + order_items_router.urls
@@ -1,39 +1,67 @@
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
 
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet, GenericViewSet
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, GenericViewSet, ReadOnlyModelViewSet
+from rest_framework.filters import OrderingFilter
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, DjangoModelPermissions
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .paginations import DefaultProductPagination
-from .signals import order_create
-from .filters import ProductFilterSet
+from core.replicas import ReplicaReadMixin
+
+from .bulk import FORMATS, ProductImporter, export_orders, export_products, guess_format, read_rows
+from .cache import CachedResponseMixin, response_cache
+from .compiled import CompiledListMixin
+from .fieldsets import SparseFieldsetViewMixin
+from . import archive, sales
+from .paginations import (CommentKeysetPagination, DefaultProductPagination, OrderKeysetPagination,
+                          ProductKeysetPagination)
+from .filters import OrderFilterSet, ProductFilterSet, ProductSearchFilter
 from .models import Cart, CartItem, Category, Customer, Order, OrderItem, Product, Comment
-from .permissions import IsAdminOrReadOnly, SendPrivateEmailToCustomer, CustomDjangoModelPermission
+from .renderers import ORJSONRenderer
+from .permissions import (IsAdminOrReadOnly, IsCustomer, IsCustomerOrAdmin, SendPrivateEmailToCustomer,
+                          CustomDjangoModelPermission)
 from .serializers import (
-                    AddCartItemSerializer, CartItemSerailizer, CartSerailizer, 
+                    AddCartItemSerializer, BatchCartItemSerializer, CartItemSerailizer, CartSerailizer, 
                     CategorySerializer, CustomerSerializer, OrderAdminSerializer, OrderItemSerializer,  
                     CommentSerializer, OrderSerializer, UpdateCartItemSerializer, ProductSerializer,
-                    OrderCreateSerializer, OrderUpdateSerailizer,
+                    OrderCreateSerializer, OrderUpdateSerailizer, TopProductSerializer,
+                    TopProductsQuerySerializer, CommentModerationSerializer,
                 )
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, CompiledListMixin, ModelViewSet):
     serializer_class = ProductSerializer
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
     queryset = Product.objects.all()
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     ordering_fields = ['name', 'inventory']
-    search_fields = ['name', 'inventory']
     pagination_class = DefaultProductPagination
+    keyset_pagination_class = ProductKeysetPagination
     # filterset_fields = ['category_id', 'inventory']
     filterset_class = ProductFilterSet
     permission_classes = [IsAdminOrReadOnly]
+    cache_resource = 'product'
+    
+    @property
+    def paginator(self):
+        # ?pagination=cursor (or any cursor link) switches to keyset pagination,
+        # which avoids COUNT(*) and OFFSET scans on deep pages.
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
     
     def get_serializer_context(self):
         return {'request': self.request}
@@ -44,35 +72,112 @@ class ProductViewSet(ModelViewSet):
             return Response({'error': 'you have orider items you should first delete then'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['POST'], url_path='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': 'Upload a CSV or NDJSON file.'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.query_params.get('type') or guess_format(upload.name)
+        key = request.query_params.get('key', 'slug')
+        if file_format not in FORMATS or key not in ('slug', 'id'):
+            return Response({'errors': 'type must be csv or ndjson and key must be slug or id'}, status=status.HTTP_400_BAD_REQUEST)
+        importer = ProductImporter(key=key, dry_run=request.query_params.get('dry_run') == 'true',
+                                   atomic=request.query_params.get('atomic') == 'true')
+        report = importer.run(read_rows(upload.file, file_format))
+        if not report['failed']:
+            return Response(report, status=status.HTTP_200_OK)
+        # Rows of earlier chunks may have been saved before later rows failed.
+        if report['created'] or report['updated']:
+            return Response(report, status=status.HTTP_207_MULTI_STATUS)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in FORMATS:
+            return Response({'errors': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = DjangoFilterBackend().filter_queryset(request, Product.objects.all(), self)
+        response = StreamingHttpResponse(export_products(queryset, file_format), content_type=FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
 
+    @action(detail=False, methods=['GET'])
+    def top(self, request):
+        query = TopProductsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rows = sales.top_products(params['start'], params['end'], params['limit'], params.get('category'))
+        return Response(TopProductSerializer(rows, many=True).data)
 
-class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.prefetch_related('products')
+
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, ModelViewSet):
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_resource = 'category'
     
     def destroy(self, request, pk):
         category = get_object_or_404(Category, pk=pk)
-        if category.products.count() > 0:
+        if category.products.exists():
             return Response({'errors': 'error you can not delete'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         category.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['GET'], url_path='top-products')
+    def top_products(self, request, pk):
+        category = get_object_or_404(Category, pk=pk)
+        query = TopProductsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rows = sales.top_products(params['start'], params['end'], params['limit'], category.pk)
+        return Response(TopProductSerializer(rows, many=True).data)
+
 
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, ModelViewSet):
     queryset = Comment.objects.select_related('product').all()
     serializer_class = CommentSerializer
+    pagination_class = CommentKeysetPagination
+    cache_resource = 'comment'
+    
+    def get_cache_scopes(self):
+        if self.action == 'list' and 'product_pk' in self.kwargs:
+            return [f"comment:product:{self.kwargs['product_pk']}"]
+        return super().get_cache_scopes()
     
     def get_queryset(self):
         if 'product_pk' in self.kwargs:
+            # The public feed of a product: approved comments, newest first.
             product_pk = self.kwargs['product_pk']
-            return Comment.objects.filter(product_id=product_pk).select_related('product')
+            return Comment.objects.filter(
+                product_id=product_pk, status=Comment.COMMENT_STATUS_APPROVED
+            ).order_by('-datetime_created', '-pk')
         else:
             return Comment.objects.select_related('product')
         
     def get_serializer_context(self):
         if 'product_pk' in self.kwargs:
-            return {'product_pk': self.kwargs['product_pk']}
+            return {'request': self.request, 'product_pk': self.kwargs['product_pk']}
+        return {'request': self.request}
+    
+    @action(detail=False, methods=['GET', 'POST'], permission_classes=[IsAdminUser])
+    def moderation(self, request, product_pk=None):
+        """Waiting comments, oldest first; POST {"ids": [...], "status": "a" or "na"} moderates them."""
+        if request.method == 'POST':
+            serializer = CommentModerationSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            queryset = Comment.objects.filter(pk__in=serializer.validated_data['ids'])
+            if product_pk is not None:
+                queryset = queryset.filter(product_id=product_pk)
+            updated = queryset.set_status(serializer.validated_data['status'])
+            return Response({'updated': updated})
+
+        queryset = Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING).order_by('datetime_created', 'pk')
+        if product_pk is not None:
+            queryset = queryset.filter(product_id=product_pk)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(CommentSerializer(page, many=True).data)
         
         
 class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
@@ -90,11 +195,33 @@ class CartItemViewSet(ModelViewSet):
         return {'cart_pk': self.kwargs['cart_pk']}
         
     def get_serializer_class(self):
+        if self.action == 'batch':
+            return BatchCartItemSerializer
         if self.request.method == 'POST':
             return AddCartItemSerializer
         elif self.request.method == 'PATCH':
             return UpdateCartItemSerializer
         return CartItemSerailizer
+    
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        Cart.objects.touch(self.kwargs['cart_pk'])
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        Cart.objects.touch(self.kwargs['cart_pk'])
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        Cart.objects.touch(self.kwargs['cart_pk'])
+    
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, cart_pk):
+        serializer = BatchCartItemSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        cart_items = serializer.save()
+        Cart.objects.touch(cart_pk)
+        return Response(CartItemSerailizer(cart_items, many=True).data, status=status.HTTP_201_CREATED)
         
 
 class CustomerViewSet(ModelViewSet):
@@ -102,10 +229,9 @@ class CustomerViewSet(ModelViewSet):
     queryset = Customer.objects.select_related('user')
     permission_classes = [IsAdminUser]
     
-    @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
+    @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsCustomer])
     def me(self, request):
-        user_id = request.user.id
-        customer = Customer.objects.select_related('user').get(user_id=user_id)
+        customer = request.user.customer
         if request.method == 'GET':    
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
@@ -121,14 +247,22 @@ class CustomerViewSet(ModelViewSet):
     
     
     
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(SparseFieldsetViewMixin, CompiledListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'options', 'head']
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilterSet
+    # Newest first, seeking through the (customer|status, datetime_created) indexes.
+    pagination_class = OrderKeysetPagination
     # permission_classes = [IsAuthenticated]
     
     def get_permissions(self):
-        if self.request.method in ['PATCH', 'DELETE']:
+        if self.request.method in ['PATCH', 'DELETE'] or self.action == 'export':
             return [IsAdminUser()]
-        return [IsAuthenticated()]
+        if self.request.method == 'POST':
+            # Orders are placed for the user's own customer, staff included.
+            return [IsCustomer()]
+        return [IsCustomerOrAdmin()]
     
 
     def get_queryset(self):
@@ -137,12 +271,30 @@ class OrderViewSet(ModelViewSet):
                 'items',
                 OrderItem.objects.select_related('product')
             )
-        ).select_related('customer__user')
+        ).select_related('customer__user').order_by('-datetime_created', '-pk')
         user = self.request.user
         if user.is_staff:
             return queryset
         
-        return queryset.filter(customer__user_id=self.request.user.id)
+        return queryset.filter(customer_id=self.request.user.customer.pk)
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # Closed orders may have been moved to cold storage (store.archive).
+            if self.action != 'retrieve':
+                raise
+            filters = {'pk': self.kwargs['pk']}
+            if not self.request.user.is_staff:
+                filters['customer_id'] = self.request.user.customer.pk
+            try:
+                order = archive.get_archived_order(**filters)
+            except (TypeError, ValueError):
+                order = None
+            if order is None:
+                raise
+            return order
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -156,20 +308,73 @@ class OrderViewSet(ModelViewSet):
     def create(self, request, *args, **kwargs):
         create_order_Serializer = OrderCreateSerializer(
             data=request.data,
-            context={'user_id': self.request.user.id}
+            context={'customer_id': self.request.user.customer.pk}
             )
         create_order_Serializer.is_valid(raise_exception=True)
         create_order = create_order_Serializer.save()
-        order_create.send_robust(self.__class__, order=create_order)
-        
+        prefetch_related_objects([create_order], Prefetch('items', OrderItem.objects.select_related('product')))
+
         serializer = OrderSerializer(create_order)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in FORMATS:
+            return Response({'errors': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        filterset = OrderFilterSet(request.query_params, queryset=Order.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export_orders(filterset.qs, file_format), content_type=FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+        return response
 
 
-class OrderItemsViewSet(ModelViewSet):
+class OrderItemsViewSet(ReadOnlyModelViewSet):
+    # Items change only through checkout; customers see those of their own orders.
     serializer_class = OrderItemSerializer
+    permission_classes = [IsCustomerOrAdmin]
     
     def get_queryset(self):
         order_pk = self.kwargs.get('order_pk')
-        return OrderItem.objects.select_related('product').filter(order_id=order_pk)
-    
\ No newline at end of file
+        queryset = OrderItem.objects.select_related('product').filter(order_id=order_pk)
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(order__customer_id=self.request.user.customer.pk)
+    
+    def get_archived_order(self):
+        filters = {'pk': self.kwargs.get('order_pk')}
+        if not self.request.user.is_staff:
+            filters['customer_id'] = self.request.user.customer.pk
+        try:
+            return archive.get_archived_order(**filters)
+        except (TypeError, ValueError):
+            return None
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data:
+            # An order without live items may be archived.
+            order = self.get_archived_order()
+            if order is not None:
+                response.data = self.get_serializer(order.items.all(), many=True).data
+        return response
+    
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve':
+                raise
+            order = self.get_archived_order()
+            items = [] if order is None else [item for item in order.items.all() if str(item.pk) == self.kwargs['pk']]
+            if not items:
+                raise
+            return items[0]
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.get_stats())